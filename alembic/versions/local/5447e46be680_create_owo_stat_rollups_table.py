@@ -0,0 +1,59 @@
+"""create owo stat rollups table
+
+Revision ID: 5447e46be680
+Revises: 70963393740d
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5447e46be680'
+down_revision: Union[str, None] = '70963393740d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Day ids are days since 2020-01-01 (US/Pacific), weeks start on sunday. See utils/date.py
+PERIOD_START_DAYS = {
+    "week": "day - EXTRACT(DOW FROM DATE '2020-01-01' + day::int)::bigint",
+    "month": "(date_trunc('month', DATE '2020-01-01' + day::int)::date - DATE '2020-01-01')",
+    "year": "(date_trunc('year', DATE '2020-01-01' + day::int)::date - DATE '2020-01-01')",
+    "all_time": "0",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'owo_stat_rollups',
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('period', sa.String(length=16), nullable=False),
+        sa.Column('start_day', sa.BigInteger(), nullable=False),
+        sa.Column('owo_count', sa.Integer(), nullable=False),
+        sa.Column('hunt_count', sa.Integer(), nullable=False),
+        sa.Column('battle_count', sa.Integer(), nullable=False),
+        sa.Column('pray_count', sa.Integer(), nullable=False),
+        sa.Column('curse_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'period', 'start_day'),
+    )
+
+    # Backfill from existing daily rows
+    for period, start_day in PERIOD_START_DAYS.items():
+        op.execute(
+            f"""
+            INSERT INTO owo_stat_rollups
+                (user_id, period, start_day, owo_count, hunt_count, battle_count, pray_count, curse_count)
+            SELECT user_id, '{period}', {start_day} AS start_day,
+                SUM(owo_count), SUM(hunt_count), SUM(battle_count), SUM(pray_count), SUM(curse_count)
+            FROM owo_stats
+            GROUP BY user_id, start_day
+            """
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('owo_stat_rollups')
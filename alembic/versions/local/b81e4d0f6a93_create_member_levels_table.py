@@ -0,0 +1,33 @@
+"""create member levels table
+
+Revision ID: b81e4d0f6a93
+Revises: 5447e46be680
+Create Date: 2026-10-17 15:20:37.912045
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81e4d0f6a93'
+down_revision: Union[str, None] = '5447e46be680'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'member_levels',
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('level', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('member_levels')
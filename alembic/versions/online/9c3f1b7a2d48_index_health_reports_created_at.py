@@ -0,0 +1,25 @@
+"""index health reports created at
+
+Revision ID: 9c3f1b7a2d48
+Revises: 02237cbe17d3
+Create Date: 2026-10-17 14:02:11.504318
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3f1b7a2d48'
+down_revision: Union[str, None] = '02237cbe17d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_health_reports_created_at', 'health_reports', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_health_reports_created_at', table_name='health_reports')
@@ -0,0 +1,87 @@
+"""
+Compare messages per second of the old and new OwO command classification.
+
+Each implementation is timed over several rounds and the best round is reported, single runs
+vary more than the difference between the two. Most messages are chat without a prefix, where both
+lowercase the message once and look for owo/uwu, so the gain comes from the command messages.
+
+Usage: python benchmarks/classifier.py [corpus] [--prefix h] [--repeat 200] [--rounds 15]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from enums.owo_command import OwOCommand  # noqa: E402
+from utils.command_classifier import CommandClassifier  # noqa: E402
+
+
+def legacy_get_command(content: str, prefix: str):
+    # Implementation of OwoCounter.get_command before the classifier
+    content = content.lower()
+    if content.startswith(prefix):
+        args = list(filter(lambda s: s.strip(), content.removeprefix(prefix).split()))
+    elif content.startswith("owo"):
+        args = list(filter(lambda s: s.strip(), content.removeprefix("owo").split()))
+    else:
+        if "owo" in content or "uwu" in content:
+            return OwOCommand.POINT, []
+        return None
+
+    command = args[0] if args else "owo"
+    args = args[1:] if len(args) > 1 else []
+    if command in {"h", "hunt", "catch"}:
+        return OwOCommand.HUNT, args
+    elif command in {"b", "battle", "fight"}:
+        return OwOCommand.BATTLE, args
+    elif command == "pray":
+        return OwOCommand.PRAY, args
+    elif command == "curse":
+        return OwOCommand.CURSE, args
+    elif command == "owo":
+        return OwOCommand.POINT, args
+    else:
+        return None
+
+
+def run(func, messages: list[str], repeat: int, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for message in messages:
+                func(message)
+        best = min(best, time.perf_counter() - start)
+    return len(messages) * repeat / best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", nargs="?", default=os.path.join(os.path.dirname(__file__), "messages.txt"))
+    parser.add_argument("--prefix", default="h")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=15)
+    options = parser.parse_args()
+
+    with open(options.corpus, encoding="utf-8") as f:
+        messages = [line.rstrip("\n") for line in f if line.strip()]
+
+    classifier = CommandClassifier((options.prefix, "owo"))
+    for message in messages:
+        old = legacy_get_command(message, options.prefix)
+        new = classifier.classify(message)
+        if (old and old[0]) != (new and new[0]):
+            raise SystemExit(f"Mismatch for {message!r}: {old} != {new}")
+
+    before = run(lambda m: legacy_get_command(m, options.prefix), messages, options.repeat, options.rounds)
+    after = run(classifier.classify, messages, options.repeat, options.rounds)
+    print(f"{len(messages)} messages x {options.repeat}, best of {options.rounds} rounds")
+    print(f"before: {before:,.0f} msg/s")
+    print(f"after:  {after:,.0f} msg/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Replay a synthetic message stream through the on_message listeners of the bot, OwO counter and level cogs.
+
+Redis is replaced by fakeredis (``pip install fakeredis lupa``) and the database sessions by a fake
+that only compiles and counts statements, so the numbers are the cost of the bot itself.
+
+Usage: python benchmarks/pipeline.py [--messages 20000] [--users 300] [--rate 50] [--unbuffered]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import discord  # noqa: E402
+from fakeredis import FakeServer  # noqa: E402
+from fakeredis.aioredis import FakeRedis  # noqa: E402
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+from cogs.level import Level  # noqa: E402
+from cogs.owocounter import OwoCounter  # noqa: E402
+import consts  # noqa: E402
+
+OWO_COMMANDS = ["owoh", "owo h", "owo hunt", "owob", "owo battle", "h", "hh", "hb", "owo", "uwu", "owo pray", "owo curse"]
+INTERACTION_NAMES = ["hunt", "battle", "pray", "curse", "owo"]
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.statements = 0
+        self.redis_commands = 0
+
+
+class FakeResult:
+    def scalars(self):
+        return self
+
+    def all(self):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+    def scalar(self):
+        return None
+
+    def scalar_one_or_none(self):
+        return None
+
+
+class FakeSession:
+    def __init__(self, stats: Stats) -> None:
+        self.stats = stats
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def begin(self):
+        return self
+
+    async def execute(self, statement, *args, **kwargs):
+        # Compiling keeps the statement building cost that a real driver would pay
+        statement.compile(dialect=postgresql.dialect())
+        self.stats.statements += 1
+        return FakeResult()
+
+    def add(self, instance):
+        self.stats.statements += 1
+
+    async def commit(self):
+        pass
+
+
+class FakeEngine:
+    async def dispose(self):
+        pass
+
+
+class CountingRedis(FakeRedis):
+    stats: Stats
+
+    async def execute_command(self, *args, **options):
+        self.stats.redis_commands += 1
+        return await super().execute_command(*args, **options)
+
+
+class FakeMember(discord.Member):
+    # Shadow the proxied properties so plain attributes can be used
+    id = bot = roles = None
+
+    def __init__(self, id: int, guild, *, bot: bool = False) -> None:
+        self.id = id
+        self.guild = guild
+        self.bot = bot
+        self.roles = []
+        self._roles = set()
+
+    async def edit(self, *, roles=None, **kwargs):
+        if roles is not None:
+            self._roles = {role.id for role in roles}
+
+
+class FakeMessage:
+    _state = None
+
+    def __init__(self, id: int, guild, channel, author, content: str, *, interaction=None, mentions=()) -> None:
+        self.id = id
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self._interaction = interaction
+        self.mentions = list(mentions)
+        self.jump_url = ""
+
+
+def generate(options, config, corpus: list[str]) -> list[FakeMessage]:
+    rng = random.Random(options.seed)
+    guild = SimpleNamespace(id=config.guild_id)
+    channel = SimpleNamespace(id=1)
+    level_channel = SimpleNamespace(id=consts.LEVEL_UP_CHANNEL_ID)
+    users = [FakeMember(10_000 + i, guild) for i in range(options.users)]
+    owo_bot = FakeMember(config.owo_id, guild, bot=True)
+    level_bot = FakeMember(consts.LEVEL_BOT_ID, guild, bot=True)
+
+    start = discord.utils.utcnow()
+    messages = []
+    for i in range(options.messages):
+        message_id = discord.utils.time_snowflake(start + datetime.timedelta(seconds=i / options.rate)) + i % 4096
+        user = rng.choice(users)
+        kind = rng.random()
+        if kind < 0.55:
+            messages.append(FakeMessage(message_id, guild, channel, user, rng.choice(corpus)))
+        elif kind < 0.90:
+            messages.append(FakeMessage(message_id, guild, channel, user, rng.choice(OWO_COMMANDS)))
+        elif kind < 0.98:
+            interaction = SimpleNamespace(name=rng.choice(INTERACTION_NAMES), user=user)
+            messages.append(FakeMessage(message_id, guild, channel, owo_bot, "", interaction=interaction))
+        else:
+            content = f"GG <@{user.id}>, you just advanced to level {rng.randint(1, 100)}!"
+            messages.append(FakeMessage(message_id, guild, level_channel, level_bot, content, mentions=[user]))
+    return messages
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+async def run(options):
+    stats = Stats()
+    CountingRedis.stats = stats
+    server = FakeServer()
+    env = {
+        "ENV": "dev",
+        "DB_URL": "postgresql+asyncpg://",
+        "LOCAL_DB_URL": "postgresql+asyncpg://",
+        "REDIS_HOST": "localhost",
+        "REDIS_PORT": "6379",
+        "REDIS_DB": "0",
+    }
+    with (
+        mock.patch.dict(os.environ, env),
+        mock.patch.object(bot_module, "create_async_engine", lambda *args, **kwargs: FakeEngine()),
+        mock.patch.object(bot_module, "async_sessionmaker", lambda *args, **kwargs: lambda: FakeSession(stats)),
+        mock.patch.object(
+            bot_module.utils, "InstrumentedRedis", lambda metrics, **kwargs: CountingRedis(server=server, **kwargs)
+        ),
+        mock.patch.object(bot_module.utils.Metrics, "instrument_engine", lambda *args: None),
+    ):
+        bot = bot_module.LXVBot()
+    if options.unbuffered:
+        bot.stat_buffer = None
+    bot._connection.user = SimpleNamespace(id=1)
+    bot.action_queue.start()
+
+    owo = OwoCounter(bot)
+    level = Level(bot)
+    level.build_index((level, 20_000 + level) for level in range(0, 101, 5))
+
+    with open(options.corpus, encoding="utf-8") as f:
+        corpus = [line.rstrip("\n") for line in f if line.strip()]
+    messages = generate(options, bot.config, corpus)
+
+    listeners = {"bot": bot.on_message, "owocounter": owo.on_message, "level": level.on_message}
+    latencies: dict[str, list[float]] = {name: [] for name in listeners}
+    totals = []
+    start = time.perf_counter()
+    for message in messages:
+        message_start = time.perf_counter()
+        for name, listener in listeners.items():
+            t0 = time.perf_counter()
+            await listener(message)
+            latencies[name].append(time.perf_counter() - t0)
+        totals.append(time.perf_counter() - message_start)
+    if bot.stat_buffer is not None:
+        await bot.stat_buffer.close()
+    await bot.action_queue.close()
+    elapsed = time.perf_counter() - start
+
+    count = len(messages)
+    print(f"{count} messages from {options.users} users, {'unbuffered' if options.unbuffered else 'buffered'} stats")
+    print(f"throughput:   {count / elapsed:,.0f} msg/s")
+    for name, samples in [*latencies.items(), ("total", totals)]:
+        p50 = percentile(samples, 50) * 1e6
+        p99 = percentile(samples, 99) * 1e6
+        print(f"{name + ':':<13} p50 {p50:8.1f}us  p99 {p99:8.1f}us")
+    print(f"db statements per message:  {stats.statements / count:.4f} ({stats.statements} total)")
+    print(f"redis commands per message: {stats.redis_commands / count:.4f} ({stats.redis_commands} total)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=50, help="Simulated messages per second")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "benchmarks", "messages.txt"))
+    parser.add_argument("--unbuffered", action="store_true", help="Write every stat directly")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    # Bot reads config.json from the working directory
+    os.chdir(ROOT)
+    asyncio.run(run(options))
+
+
+if __name__ == "__main__":
+    main()
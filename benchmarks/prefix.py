@@ -0,0 +1,106 @@
+"""
+Compare the old and new command case normalization of LXVBot.on_message.
+
+Message lengths follow a log-normal distribution (median ~40 characters, long tail up to the
+2000 character limit) filled with words from the corpus, a small share starts with a prefix.
+
+Usage: python benchmarks/prefix.py [corpus] [--messages 20000] [--commands 0.03] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bot import lower_command_token  # noqa: E402
+
+PREFIXES = ["lxv ", "LXV ", "Lxv", "test!", "<@1> "]
+
+
+def legacy_lower_command_token(content: str) -> str:
+    # Implementation of LXVBot.on_message before the prefix check
+    if content:
+        segments = content.split(" ")
+        segments[0] = segments[0].lower()
+        content = " ".join(segments)
+    return content
+
+
+def generate(corpus: list[str], count: int, commands: float, rng: random.Random) -> list[str]:
+    words = [word for line in corpus for word in line.split()]
+    messages = []
+    for _ in range(count):
+        length = min(int(rng.lognormvariate(3.7, 1.0)), 2000)
+        parts = []
+        size = 0
+        while size < length:
+            word = rng.choice(words)
+            parts.append(word)
+            size += len(word) + 1
+        content = " ".join(parts)[:2000]
+        if rng.random() < commands:
+            content = rng.choice(PREFIXES) + rng.choice(["Help", "ping", "CR", "top hunt"]) + " " + content
+        messages.append(content)
+    return messages
+
+
+def run(func, messages: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            func(message)
+    return len(messages) * repeat / (time.perf_counter() - start)
+
+
+def peak_allocated(func, messages: list[str]) -> int:
+    """Sum over messages of the peak memory allocated while normalizing it"""
+    tracemalloc.start()
+    total = 0
+    for message in messages:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = func(message)
+        total += tracemalloc.get_traced_memory()[1] - before
+        del result
+    tracemalloc.stop()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", nargs="?", default=os.path.join(os.path.dirname(__file__), "messages.txt"))
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--commands", type=float, default=0.03, help="Share of messages starting with a prefix")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    with open(options.corpus, encoding="utf-8") as f:
+        corpus = [line.rstrip("\n") for line in f if line.strip()]
+    messages = generate(corpus, options.messages, options.commands, random.Random(options.seed))
+
+    # Text prefixes have to resolve the same, mentions are matched case sensitively either way
+    for message in messages:
+        old = legacy_lower_command_token(message)
+        new = lower_command_token(message)
+        if old.lower().startswith(("lxv", "test!")) and old != new:
+            raise SystemExit(f"Mismatch for {message[:50]!r}")
+
+    lengths = sorted(len(message) for message in messages)
+    print(
+        f"{len(messages)} messages x {options.repeat}, length p50 {lengths[len(lengths) // 2]} p99 {lengths[len(lengths) * 99 // 100]}"
+    )
+    before = run(legacy_lower_command_token, messages, options.repeat)
+    after = run(lower_command_token, messages, options.repeat)
+    old_bytes = peak_allocated(legacy_lower_command_token, messages) / len(messages)
+    new_bytes = peak_allocated(lower_command_token, messages) / len(messages)
+    print(f"before: {before:,.0f} msg/s, {old_bytes:,.0f} B allocated/msg")
+    print(f"after:  {after:,.0f} msg/s ({after / before:.2f}x), {new_bytes:,.0f} B allocated/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 from glob import glob
 from io import BytesIO
@@ -6,17 +7,17 @@ import logging
 from os import getenv
 from os.path import relpath
 import random
-from time import time_ns
+from time import perf_counter, time_ns
 from traceback import format_exception
-from typing import Any, Optional, Union
+from typing import Any, Awaitable, Optional, Tuple, TypeVar, Union
+import weakref
 import zoneinfo
 
 import aiohttp
 import discord
-from discord.ext import commands, tasks
-from redis.asyncio import Redis
+from discord.ext import commands
 from sqlalchemy import select, text
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 
 import configs
 import consts
@@ -30,6 +31,44 @@ PRODUCTION = "production"
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Lowercase text prefixes (production and dev), mention prefixes need no case change
+COMMAND_PREFIXES = (consts.BOT_PREFIX, "test!")
+PREFIX_LENGTH = max(len(prefix) for prefix in COMMAND_PREFIXES)
+
+
+def lower_command_token(content: str) -> str:
+    """
+    Lowercase the first space separated token of ``content`` when it starts with a text prefix,
+    so commands are case insensitive. Anything else is returned as is without copying.
+    """
+    if not content[:PREFIX_LENGTH].lower().startswith(COMMAND_PREFIXES):
+        return content
+    end = content.find(" ")
+    token = content if end == -1 else content[:end]
+    lowered = token.lower()
+    if lowered == token:
+        return content
+    return lowered if end == -1 else lowered + content[end:]
+
+
+@commands.command(name="jsk", aliases=["jishaku"], hidden=True)
+@commands.is_owner()
+async def lazy_jishaku(ctx: commands.Context):
+    """Load jishaku on first use and run the command with it"""
+    bot = ctx.bot
+    # Jishaku registers the same names
+    bot.remove_command(lazy_jishaku.name)
+    start = perf_counter()
+    try:
+        await bot.load_extension("jishaku")
+    except Exception:
+        bot.add_command(lazy_jishaku)
+        raise
+    logger.info("Loaded jishaku in %.0fms", (perf_counter() - start) * 1000)
+    await bot.invoke(await bot.get_context(ctx.message))
+
 
 class NewHelpCommand(commands.MinimalHelpCommand):
     def __init__(self, **options):
@@ -101,20 +140,77 @@ class LXVBot(commands.Bot):
         self._BotBase__cogs = commands.core._CaseInsensitiveDict()
         self.launch_timestamp = time_ns() // 1000000000
         self.xp_cooldowns = set()
-        self.engine = create_async_engine(db_url, echo=self.is_dev)
+        self.metrics = utils.Metrics(enabled=self.config.metrics.enabled)
+        self.engine = self.create_engine(db_url, self.config.database.online)
         self.async_session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.metrics.instrument_engine(self.engine, "online")
 
-        self.lengine = create_async_engine(local_db_url, echo=self.is_dev)
+        self.lengine = self.create_engine(local_db_url, self.config.database.local)
         self.lasync_session = async_sessionmaker(self.lengine, expire_on_commit=False)
+        self.metrics.instrument_engine(self.lengine, "local")
 
-        self.redis = Redis(host=redis_host, port=redis_port, db=redis_db, decode_responses=True)
+        self.redis = utils.InstrumentedRedis(
+            self.metrics, host=redis_host, port=redis_port, db=redis_db, decode_responses=True
+        )
+        self.leaderboard = utils.Leaderboard(self.redis)
+        # Settings shared with other processes through redis, see get_setting
+        self.cache_bus = utils.CacheBus(self.redis)
+        self.settings = utils.TwoTierCache(self.redis, self.cache_bus, "settings", ttl=3600)
+        self.settings.add_listener(self._reload_settings)
+        self.metrics.add_cache("settings", self.settings)
+        self.stat_writer = utils.StatWriter(self.lasync_session, leaderboard=self.leaderboard)
+        # Flush interval of 0 disables buffering and writes every increment directly
+        self.stat_buffer: Optional[utils.StatBuffer] = None
+        if self.config.stat_buffer.flush_interval > 0:
+            self.stat_buffer = utils.StatBuffer(
+                self.stat_writer,
+                flush_interval=self.config.stat_buffer.flush_interval,
+                max_pending=self.config.stat_buffer.max_pending,
+            )
+            self.metrics.add_gauge("stat_buffer_pending", self.stat_buffer.__len__)
+        # Role edits from commands, level ups and background jobs share one prioritized queue
+        self.action_queue = utils.ActionQueue(self.http)
+        self.metrics.add_gauge("action_queue_depth", self.action_queue.__len__)
+        self.icon_cache = utils.IconCache(
+            self.config.icon_cache.directory,
+            memory_bytes=self.config.icon_cache.memory_bytes,
+            disk_bytes=self.config.icon_cache.disk_bytes,
+        )
         self.mod_ids = set()
-        self.user_mods = set()
+        # Mod decisions (positive and negative) keyed by (guild id, member id), invalidated by events
+        # and expired in case one is missed
+        self.mod_cache: utils.TTLCache[Tuple[int, int], bool] = utils.TTLCache(maxsize=10000, ttl=600)
+        self.metrics.add_cache("mod", self.mod_cache)
+        self.add_listener(self._invalidate_member_update, "on_member_update")
+        self.add_listener(self._invalidate_member_remove, "on_raw_member_remove")
+        self.add_listener(self._invalidate_role_delete, "on_guild_role_delete")
+        self.add_listener(self._invalidate_role_update, "on_guild_role_update")
+        self.add_listener(self._invalidate_guild_update, "on_guild_update")
+        # Text and hybrid commands, invoked by message or interaction, share the before invoke hook
+        # and completion events. App only commands are timed from the interaction creation
+        self._command_starts: weakref.WeakKeyDictionary[commands.Context, float] = weakref.WeakKeyDictionary()
+        if self.metrics.enabled:
+            self.before_invoke(self._start_command_timer)
+            self.add_listener(self._observe_command, "on_command_completion")
+            self.add_listener(self._observe_command, "on_command_error")
+            self.add_listener(self._observe_app_command, "on_app_command_completion")
 
     @property
     def is_dev(self) -> bool:
         return self.bot_mode == DEV
 
+    def create_engine(self, url: str, pool: configs.DatabasePool) -> AsyncEngine:
+        return create_async_engine(
+            url,
+            echo=self.is_dev,
+            pool_size=pool.pool_size,
+            max_overflow=pool.max_overflow,
+            pool_timeout=pool.pool_timeout,
+            pool_recycle=pool.pool_recycle,
+            pool_pre_ping=pool.pool_pre_ping,
+            connect_args={"prepared_statement_cache_size": pool.prepared_statement_cache_size},
+        )
+
     def get_day_id(self, date: datetime.datetime) -> int:
         tz = zoneinfo.ZoneInfo("US/Pacific")
         base_date = datetime.datetime(2020, 1, 1, tzinfo=tz)
@@ -129,20 +225,44 @@ class LXVBot(commands.Bot):
     def is_mod(self, member: discord.Member, include_bot_owner: bool = True) -> bool:
         if member.bot:
             return False
-        if member.id in self.user_mods:
+        if include_bot_owner and self.owner.id == member.id:
             return True
-        allowed = False
-        if (include_bot_owner and self.owner.id == member.id) or member.guild_permissions.administrator:
-            allowed = True
-            self.user_mods.add(member.id)
-        else:
-            for r in member.roles:
-                if r.id in self.mod_ids:
-                    allowed = True
-                    self.user_mods.add(member.id)
-                    break
+
+        key = (member.guild.id, member.id)
+        allowed = self.mod_cache.get(key)
+        if allowed is None:
+            allowed = member.guild_permissions.administrator or any(r.id in self.mod_ids for r in member.roles)
+            self.mod_cache.set(key, allowed)
         return allowed
 
+    def invalidate_mod_cache(self, guild_id: Optional[int] = None, member_id: Optional[int] = None):
+        """Forget cached mod decisions of a member, a whole guild or everything"""
+        if guild_id is None:
+            self.mod_cache.clear()
+        elif member_id is None:
+            self.mod_cache.invalidate_where(lambda key: key[0] == guild_id)
+        else:
+            self.mod_cache.invalidate((guild_id, member_id))
+
+    async def _invalidate_member_update(self, before: discord.Member, after: discord.Member):
+        if before._roles != after._roles:
+            self.invalidate_mod_cache(after.guild.id, after.id)
+
+    async def _invalidate_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.invalidate_mod_cache(payload.guild_id, payload.user.id)
+
+    async def _invalidate_role_delete(self, role: discord.Role):
+        self.invalidate_mod_cache(role.guild.id)
+
+    async def _invalidate_role_update(self, before: discord.Role, after: discord.Role):
+        if before.permissions.administrator != after.permissions.administrator:
+            self.invalidate_mod_cache(after.guild.id)
+
+    async def _invalidate_guild_update(self, before: discord.Guild, after: discord.Guild):
+        # Guild owner always has administrator
+        if before.owner_id != after.owner_id:
+            self.invalidate_mod_cache(after.id)
+
     def mod_only(self, ctx: commands.Context, include_bot_owner: bool = True) -> bool:
         if not isinstance(ctx.author, discord.Member):
             return False
@@ -175,43 +295,81 @@ class LXVBot(commands.Bot):
         return await super().get_prefix(message)
 
     async def get_setting(self):
+        self.mod_ids = set(await self.settings.get_or_load("mod_ids", self._load_mod_ids))
+        self.invalidate_mod_cache()
+
+    async def _load_mod_ids(self) -> list[int]:
         async with self.async_session() as session:
             mods = await session.execute(select(models.Mod.id))
-            self.mod_ids = {row[0] for row in mods}
+            return sorted(row[0] for row in mods)
+
+    async def _reload_settings(self, key: Optional[str]):
+        # Changed by another process
+        if key in {"mod_ids", None}:
+            await self.get_setting()
 
     async def setup_hook(self) -> None:
         if self.is_dev:
             logger.warning("Bot is running in dev mode. Consider using production mode later")
 
-        # Load cogs
-        for file in glob(r"cogs/*.py"):
-            module_name = relpath(file).replace("\\", '.').replace('/', '.')[:-3]
-            await self.load_extension(module_name)
-        await self.load_extension("jishaku")
-        logger.info("Module loaded")
+        start = perf_counter()
+        self.session = aiohttp.ClientSession()
+        self.cache_bus.start()
+
+        # Cogs, the owner and settings don't depend on each other, cog warm-ups (level roles,
+        # custom roles) run inside their load
+        extensions = [relpath(file).replace("\\", ".").replace("/", ".")[:-3] for file in glob(r"cogs/*.py")]
+        await asyncio.gather(
+            *(self._timed(f"extension {name}", self.load_extension(name)) for name in extensions),
+            self._timed("owner", self._load_owner()),
+            self._timed("settings", self.get_setting()),
+        )
+        # Jishaku is only imported once an owner uses it
+        self.add_command(lazy_jishaku)
 
-        self.owner = self.get_user(436376194166816770) or await self.fetch_user(436376194166816770)
-        logger.info("Application info loaded")
+        if self.stat_buffer is not None:
+            self.stat_buffer.start()
+        self.action_queue.start()
 
-        await self.get_setting()
-        logger.info("Setting loaded")
+        if self.config.metrics.port:
+            await self._timed(
+                "metrics server", self.metrics.start_server(self.config.metrics.host, self.config.metrics.port)
+            )
+        logger.info("Setup finished in %.0fms", (perf_counter() - start) * 1000)
 
-        self.session = aiohttp.ClientSession()
-        logger.info("Session created")
+    async def _timed(self, phase: str, coro: Awaitable[T]) -> T:
+        start = perf_counter()
+        result = await coro
+        elapsed = perf_counter() - start
+        self.metrics.observe("startup_seconds", elapsed, phase=phase)
+        logger.info("Startup phase %s took %.0fms", phase, elapsed * 1000)
+        return result
 
-        self.refresh_cache.start()
+    async def _load_owner(self):
+        self.owner = self.get_user(436376194166816770) or await self.fetch_user(436376194166816770)
 
     async def close(self) -> None:
+        # Stop receiving events first so nothing is added to the buffer after the final flush
+        await super().close()
+        if self.stat_buffer is not None:
+            try:
+                await self.stat_buffer.close()
+            except Exception as e:
+                logger.error("Failed to flush stat buffer on close", exc_info=e)
+        await self.action_queue.close()
+        await self.cache_bus.close()
+        await self.metrics.stop_server()
         await self.engine.dispose()
-        return await super().close()
+        await self.lengine.dispose()
 
     async def get_db_ping(self) -> Optional[int]:
         if self.engine is None:
             return None
-        t0 = time_ns()
         async with self.engine.connect() as conn:
+            # Only time the round trip, not the checkout
+            t0 = time_ns()
             await conn.execute(text("SELECT 1"))
-        t1 = time_ns()
+            t1 = time_ns()
         return (t1 - t0) // 10000000
 
     async def send_owner(self, message=None, **kwargs) -> None:
@@ -242,22 +400,44 @@ class LXVBot(commands.Bot):
             )
             await self.send_owner(embed=custom_embed)
 
+    async def _run_event(self, coro, event_name: str, *args: Any, **kwargs: Any) -> None:
+        if not self.metrics.enabled:
+            return await super()._run_event(coro, event_name, *args, **kwargs)
+        start = perf_counter()
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            self.metrics.observe("listener_seconds", perf_counter() - start, event=event_name, listener=coro.__qualname__)
+
+    async def _start_command_timer(self, ctx: commands.Context):
+        self._command_starts[ctx] = perf_counter()
+
+    async def _observe_command(self, ctx: commands.Context, error: Optional[Exception] = None):
+        # Commands failing their checks never started
+        start = self._command_starts.pop(ctx, None)
+        if start is not None and ctx.command is not None:
+            self.metrics.observe("command_seconds", perf_counter() - start, command=ctx.command.qualified_name)
+
+    async def _observe_app_command(
+        self,
+        interaction: discord.Interaction,
+        command: Union[discord.app_commands.Command, discord.app_commands.ContextMenu],
+    ):
+        # Hybrid commands are timed through their context like text commands
+        if isinstance(getattr(command, "wrapped", None), commands.HybridCommand):
+            return
+        elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        self.metrics.observe("command_seconds", elapsed, command=command.qualified_name)
+
     async def on_message(self, message: discord.Message) -> None:
         if message.author.bot:
             return
 
         # Set first segment to lowercase to allow lowercase command
-        if message.content:
-            segments = message.content.split(" ")
-            segments[0] = segments[0].lower()
-            message.content = " ".join(segments)
+        message.content = lower_command_token(message.content)
 
         return await super().on_message(message)
 
-    @tasks.loop(minutes=1)
-    async def refresh_cache(self):
-        self.user_mods = set()
-
 
 def slash_is_enabled():
     def wrapper(interaction: discord.Interaction):
@@ -0,0 +1,126 @@
+from __future__ import annotations
+from collections import deque
+import datetime
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Deque, Dict, Mapping, Tuple
+
+import discord
+from discord.ext import commands, tasks
+from sqlalchemy import delete, insert
+
+import models
+
+if TYPE_CHECKING:
+    from bot import LXVBot
+
+logger = logging.getLogger(__name__)
+
+
+class Health(commands.Cog):
+    """
+    Samples in-process gauges into a ring buffer and writes them to ``health_reports`` in batches
+    """
+
+    def __init__(self, bot: LXVBot) -> None:
+        self.bot = bot
+        self.config = self.bot.config.health
+        # Oldest samples are dropped first when the database is unreachable for too long
+        self.samples: Deque[Tuple[datetime.datetime, Dict[str, float]]] = deque(maxlen=self.config.max_samples)
+        self.messages = 0
+        self.counted_stats = 0
+        self._last_sample = time.monotonic()
+        self._last_counters = (0, 0, 0, 0)
+        self.sample.change_interval(seconds=self.config.sample_interval)
+        self.flush.change_interval(seconds=self.config.flush_interval)
+
+    async def cog_load(self):
+        self.bot.stat_writer.add_listener(self.count_stats)
+        self.sample.start()
+        self.flush.start()
+        self.prune.start()
+
+    async def cog_unload(self):
+        self.bot.stat_writer.remove_listener(self.count_stats)
+        self.sample.cancel()
+        self.flush.cancel()
+        self.prune.cancel()
+        # Write what is left
+        await self.flush()
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        self.messages += 1
+
+    def count_stats(self, deltas: Mapping[Tuple[int, int], Dict[str, int]]):
+        self.counted_stats += sum(sum(columns.values()) for columns in deltas.values())
+
+    def collect(self) -> Dict[str, float]:
+        now = time.monotonic()
+        minutes = max(now - self._last_sample, 1e-9) / 60
+        counters = (self.messages, self.counted_stats, self.bot.mod_cache.hits, self.bot.mod_cache.misses)
+        messages, counted_stats, hits, misses = (a - b for a, b in zip(counters, self._last_counters))
+        self._last_sample = now
+        self._last_counters = counters
+
+        data = self.bot.metrics.read_gauges()
+        data["messages_per_minute"] = round(messages / minutes, 2)
+        data["counted_stats_per_minute"] = round(counted_stats / minutes, 2)
+        if hits + misses:
+            data["mod_cache_hit_rate"] = round(hits / (hits + misses), 4)
+        # Latency is nan until the first heartbeat, which json can't store
+        if math.isfinite(self.bot.latency):
+            data["latency_ms"] = round(self.bot.latency * 1000, 2)
+
+        role_cog = self.bot.get_cog("Role")
+        if role_cog is not None:
+            data["total_custom_roles"] = len(role_cog.custom_roles)  # type: ignore
+        return data
+
+    @tasks.loop(seconds=60)
+    async def sample(self):
+        self.samples.append((discord.utils.utcnow(), self.collect()))
+
+    @tasks.loop(seconds=900)
+    async def flush(self):
+        if not self.samples:
+            return
+        samples = list(self.samples)
+        self.samples.clear()
+        try:
+            async with self.bot.async_session() as session:
+                async with session.begin():
+                    await session.execute(
+                        insert(models.HealthReport),
+                        [{"data": data, "created_at": created_at} for created_at, data in samples],
+                    )
+        except BaseException as e:
+            # Put them back in front of anything sampled meanwhile, dropping the oldest if full
+            pending = samples + list(self.samples)
+            self.samples.clear()
+            self.samples.extend(pending)
+            if not isinstance(e, Exception):
+                raise
+            logger.error("Failed to write %s health sample(s)", len(samples), exc_info=e)
+            return
+        logger.debug("Wrote %s health sample(s)", len(samples))
+
+    @tasks.loop(hours=24)
+    async def prune(self):
+        cutoff = discord.utils.utcnow() - datetime.timedelta(days=self.config.retention_days)
+        try:
+            # Range on the created_at index
+            async with self.bot.async_session() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        delete(models.HealthReport).where(models.HealthReport.created_at < cutoff)
+                    )
+        except Exception as e:
+            logger.error("Failed to prune health reports", exc_info=e)
+            return
+        logger.info("Pruned %s health report(s)", result.rowcount)
+
+
+async def setup(bot: LXVBot):
+    await bot.add_cog(Health(bot))
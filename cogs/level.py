@@ -1,15 +1,19 @@
 from __future__ import annotations
+import asyncio
 import bisect
+import functools
 import logging
 import re
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, AbstractSet, Dict, FrozenSet, Iterable, Optional
 
 import discord
 from discord.ext import commands
 from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
 
 import check
 import consts
+from enums.action_priority import ActionPriority
 import models
 
 if TYPE_CHECKING:
@@ -17,28 +21,85 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+LEVEL_UP_PATTERN = re.compile(r"advanced to level (\d+)!")
+
+# Redis keys of the running reconcile, kept until it finishes so it can resume after a restart
+RECONCILE_CURSOR_KEY = "level_reconcile:cursor"
+RECONCILE_PROGRESS_KEY = "level_reconcile:progress"
+RECONCILE_CHUNK_SIZE = 100
+
 
 class Level(commands.GroupCog, group_name="level"):
     def __init__(self, bot: LXVBot) -> None:
         self.bot = bot
         self.role_assigns = []
-        self.role_level_ids = []
+        # Sorted levels of role_assigns, the role to hold is the one of the last level reached
+        self.role_levels: list[int] = []
+        # Level roles removed when another level role is given
+        self.managed_role_ids: FrozenSet[int] = frozenset()
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+    async def cog_unload(self):
+        self.bot.settings.remove_listener(self._reload_setting)
+        if self._reconcile_task is not None:
+            # Cursor stays in redis, the job resumes on next load
+            self._reconcile_task.cancel()
 
     def cog_check(self, ctx: commands.Context):
         return ctx.guild is not None and ctx.guild.id == consts.GUILD_ID
 
     async def cog_load(self):
         await self.get_setting()
+        self.bot.settings.add_listener(self._reload_setting)
+        if await self.bot.redis.exists(RECONCILE_CURSOR_KEY):
+            logger.info("Resuming level role reconcile")
+            self.start_reconcile(resume=True)
+
+    async def get_setting(self, *, refresh: bool = False):
+        """Load level roles from the shared settings cache, ``refresh`` reads the database and publishes"""
+        if refresh:
+            role_assigns = await self._load_role_assigns()
+            await self.bot.settings.set("role_assigns", role_assigns)
+        else:
+            role_assigns = await self.bot.settings.get_or_load("role_assigns", self._load_role_assigns)
+        self.build_index((level, role_id) for level, role_id in role_assigns)
 
-    async def get_setting(self):
+    async def _load_role_assigns(self) -> list[tuple[int, int]]:
         async with self.bot.async_session() as session:
-            self.role_assigns = []
-            self.role_level_ids = []
             role_assigns = await session.execute(select(models.RoleAssign))
-            for row in role_assigns.scalars():
-                bisect.insort(self.role_assigns, (row.level, row.role_id))
-                if row.level % 10 == 0:
-                    self.role_level_ids.append(row.role_id)
+            return [(row.level, row.role_id) for row in role_assigns.scalars()]
+
+    async def _reload_setting(self, key: Optional[str]):
+        if key in {"role_assigns", None}:
+            await self.get_setting()
+
+    def build_index(self, role_assigns: Iterable[tuple[int, int]]):
+        self.role_assigns = sorted(role_assigns)
+        self.role_levels = [level for level, _ in self.role_assigns]
+        self.managed_role_ids = frozenset(role_id for level, role_id in self.role_assigns if level % 10 == 0)
+
+    def role_for_level(self, level: int) -> Optional[int]:
+        if level < 0:
+            return None
+        # Last role reached, the highest role id wins when several share a level
+        idx = bisect.bisect_right(self.role_levels, level) - 1
+        return self.role_assigns[idx][1] if idx >= 0 else None
+
+    def desired_role_ids(self, role_ids: AbstractSet[int], level: int) -> Optional[set[int]]:
+        """Roles a member holding ``role_ids`` should have at ``level``, None when nothing changes"""
+        role_id = self.role_for_level(level)
+        if role_id is None:
+            return None
+        desired = (role_ids - self.managed_role_ids) | {role_id}
+        return desired if desired != role_ids else None
+
+    def role_changes(self, level: int) -> Dict[int, bool]:
+        """Role additions and removals for :meth:`utils.ActionQueue.edit_member_roles` at ``level``"""
+        role_id = self.role_for_level(level)
+        changes = {managed_id: False for managed_id in self.managed_role_ids}
+        if role_id is not None:
+            changes[role_id] = True
+        return changes
 
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
@@ -57,29 +118,150 @@ class Level(commands.GroupCog, group_name="level"):
             user = message.mentions[0]
             if not isinstance(user, discord.Member):
                 return
-            match = re.search(r"advanced to level (\d+)!", message.content)
+            match = LEVEL_UP_PATTERN.search(message.content)
             if match:
                 level = int(match.group(1))
-                idx = bisect.bisect_right(self.role_assigns, (level, 99999999999999999999)) - 1
-                if idx >= 0:
-                    role_id = self.role_assigns[idx][1]
-                    removed = []
-                    assign = True
-                    for role in user.roles:
-                        if role.id == role_id:
-                            assign = False
-                        else:
-                            idx = bisect.bisect_left(self.role_level_ids, role.id)
-                            if idx < len(self.role_level_ids) and self.role_level_ids[idx] == role.id:
-                                removed.append(role)
-                    if assign:
-                        await user.add_roles(discord.Object(role_id))
-                    if removed:
-                        await user.remove_roles(*removed)
+                try:
+                    await self.save_level(user.id, level)
+                except Exception as e:
+                    # Only used by reconcile, don't hold the role update back
+                    logger.error("Failed to save level of %s", user.id, exc_info=e)
+                # Member roles exclude the default role
+                if self.desired_role_ids(set(user._roles), level) is not None:
+                    future = self.bot.action_queue.edit_member_roles(
+                        user, self.role_changes(level), priority=ActionPriority.LEVEL_UP, reason="Level up"
+                    )
+                    future.add_done_callback(functools.partial(self._log_level_up_failure, user.id))
             return
         if message.author.bot:
             return
 
+    @staticmethod
+    def _log_level_up_failure(user_id: int, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Failed to update level roles of %s", user_id, exc_info=future.exception())
+
+    async def save_level(self, user_id: int, level: int):
+        stmt = insert(models.MemberLevel).values(user_id=user_id, level=level, updated_at=discord.utils.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.MemberLevel.user_id],
+            set_={"level": stmt.excluded.level, "updated_at": stmt.excluded.updated_at},
+        )
+        async with self.bot.lasync_session() as session:
+            async with session.begin():
+                await session.execute(stmt)
+
+    # region Reconcile
+    def start_reconcile(self, *, resume: bool = False) -> bool:
+        if self._reconcile_task is not None and not self._reconcile_task.done():
+            return False
+        self._reconcile_task = asyncio.create_task(self.reconcile(resume=resume))
+        return True
+
+    async def reconcile(self, *, resume: bool = False):
+        """
+        Apply level roles to every cached guild member with a stored level.
+
+        Members are walked in id order in chunks, the last processed id is kept in redis
+        so a restarted job continues where it stopped. Edits of a chunk go through the
+        action queue at background priority, behind commands and level ups.
+        """
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(consts.GUILD_ID)
+        if guild is None:
+            logger.warning("Guild is not available, skipping level role reconcile")
+            return
+
+        cursor = 0
+        progress = {"processed": 0, "changed": 0, "failed": 0}
+        if resume:
+            cursor = int(await self.bot.redis.get(RECONCILE_CURSOR_KEY) or 0)
+            progress.update(
+                {key: int(value) for key, value in (await self.bot.redis.hgetall(RECONCILE_PROGRESS_KEY)).items()}
+            )
+        else:
+            await self.bot.redis.delete(RECONCILE_PROGRESS_KEY)
+
+        members = sorted((member for member in guild.members if member.id > cursor and not member.bot), key=lambda m: m.id)
+        progress["total"] = progress["processed"] + len(members)
+        logger.info("Reconciling level roles of %s member(s) after %s", len(members), cursor)
+
+        try:
+            for i in range(0, len(members), RECONCILE_CHUNK_SIZE):
+                chunk = members[i : i + RECONCILE_CHUNK_SIZE]
+                levels = await self.get_levels([member.id for member in chunk])
+                edits = {}
+                for member in chunk:
+                    level = levels.get(member.id)
+                    if level is not None and self.desired_role_ids(set(member._roles), level) is not None:
+                        edits[member.id] = self.bot.action_queue.edit_member_roles(
+                            member, self.role_changes(level), reason="Level role reconcile"
+                        )
+                results = await asyncio.gather(*edits.values(), return_exceptions=True)
+                for member_id, result in zip(edits, results):
+                    if isinstance(result, discord.HTTPException):
+                        logger.warning("Failed to reconcile level roles of %s: %s", member_id, result)
+                        progress["failed"] += 1
+                    elif isinstance(result, BaseException):
+                        raise result
+                    elif result:
+                        progress["changed"] += 1
+                progress["processed"] += len(chunk)
+
+                async with self.bot.redis.pipeline(transaction=True) as pipe:
+                    pipe.set(RECONCILE_CURSOR_KEY, chunk[-1].id)
+                    pipe.hset(RECONCILE_PROGRESS_KEY, mapping=progress)
+                    await pipe.execute()
+        except asyncio.CancelledError:
+            logger.info("Level role reconcile stopped at %s/%s", progress["processed"], progress["total"])
+            raise
+        except Exception as e:
+            logger.error("Level role reconcile failed, resume it with the reconcile command", exc_info=e)
+            return
+
+        await self.bot.redis.delete(RECONCILE_CURSOR_KEY)
+        logger.info("Level role reconcile finished: %s", progress)
+
+    async def get_levels(self, user_ids: list[int]) -> Dict[int, int]:
+        async with self.bot.lasync_session() as session:
+            cursor = await session.execute(
+                select(models.MemberLevel.user_id, models.MemberLevel.level).where(models.MemberLevel.user_id.in_(user_ids))
+            )
+            return dict(cursor.tuples().all())
+
+    @commands.command(name="reconcilelevels", aliases=["rcl"])
+    @check.is_mod()
+    async def reconcile_levels(self, ctx: commands.Context, action: str = "start"):
+        """
+        Apply level roles to every member from their last known level
+
+        Actions: start (resumes an unfinished run), restart, stop, status
+        """
+        action = action.lower()
+        running = self._reconcile_task is not None and not self._reconcile_task.done()
+        if action in {"start", "restart"}:
+            if running:
+                return await ctx.reply("Reconcile is already running", mention_author=False)
+            resume = action == "start" and bool(await self.bot.redis.exists(RECONCILE_CURSOR_KEY))
+            self.start_reconcile(resume=resume)
+            return await ctx.reply(f"{'Resumed' if resume else 'Started'} level role reconcile", mention_author=False)
+        if action == "stop":
+            if not running:
+                return await ctx.reply("Reconcile is not running", mention_author=False)
+            self._reconcile_task.cancel()  # type: ignore
+            return await ctx.reply("Stopped level role reconcile, start to resume", mention_author=False)
+        if action == "status":
+            progress = await self.bot.redis.hgetall(RECONCILE_PROGRESS_KEY)
+            if not progress:
+                return await ctx.reply("No reconcile progress recorded", mention_author=False)
+            return await ctx.reply(
+                f"{'Running' if running else 'Not running'}: {progress.get('processed', 0)}/{progress.get('total', '?')} processed, "
+                f"{progress.get('changed', 0)} changed, {progress.get('failed', 0)} failed",
+                mention_author=False,
+            )
+        await ctx.reply("Unknown action, use start, restart, stop or status", delete_after=5)
+
+    # region Commands
     @commands.command(name="levelrole", aliases=["lr"])
     @check.is_mod()
     async def level_role(self, ctx: commands.Context):
@@ -118,7 +300,10 @@ class Level(commands.GroupCog, group_name="level"):
             await ctx.reply(f"Removed role {role.mention}", mention_author=False)
         else:
             await ctx.reply(f"Set role {role.mention} to level {level}", mention_author=False)
-        await self.get_setting()
+        await self.get_setting(refresh=True)
+        # Existing members follow the new thresholds
+        if not self.start_reconcile():
+            await ctx.send("Level role reconcile is running, restart it once it finishes to apply this change")
 
 
 async def setup(bot: LXVBot):
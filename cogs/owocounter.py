@@ -1,20 +1,21 @@
 from __future__ import annotations
 import asyncio
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
 import datetime
 import logging
-from typing import TYPE_CHECKING, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, Mapping, Optional, Tuple
 import zoneinfo
 
 import discord
-from discord.ext import commands, menus
-from sqlalchemy import delete, func, literal_column, select, union_all, update
+from discord.ext import commands, menus, tasks
+from sqlalchemy import func, select, tuple_
 
 from enums.owo_command import OwOCommand
+from enums.stat_period import StatPeriod
 import models
 import utils
-from utils.cache import LRUCache
-from utils.paginators import QueryEmbedSource, SimplePages
+from utils.paginators import LeaderboardSource, QueryEmbedSource, QueryPageCache, SimplePages
 from utils.view_util import ConfirmEmbed
 
 if TYPE_CHECKING:
@@ -23,19 +24,75 @@ if TYPE_CHECKING:
 
 GLOBAL_LOCK_ID = -1
 
+STAT_COLUMN_BY_COMMAND = {
+    OwOCommand.POINT: "owo_count",
+    OwOCommand.HUNT: "hunt_count",
+    OwOCommand.BATTLE: "battle_count",
+    OwOCommand.PRAY: "pray_count",
+    OwOCommand.CURSE: "curse_count",
+}
+
+# Timestamps and durations in milliseconds. Returns 1 when the point is counted
+POINT_COOLDOWN_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cooldown = tonumber(ARGV[2])
+local penalty = tonumber(ARGV[3])
+local max_penalty = tonumber(ARGV[4])
+
+-- Values stored as ISO strings before the switch to epoch milliseconds are treated as expired
+local last = tonumber(redis.call("GET", KEYS[1]))
+if last ~= nil then
+    local diff = now - last
+    if diff < cooldown then
+        -- Future cooldown
+        if diff > -max_penalty then
+            local new_time = last + penalty
+            redis.call("SET", KEYS[1], new_time, "PXAT", new_time + cooldown)
+        end
+        return 0
+    end
+end
+
+redis.call("SET", KEYS[1], now, "PXAT", now + cooldown)
+return 1
+"""
+
+# Seconds an identical leaderboard query is shared between invocations
+TOP_CACHE_TTL = 30.0
+
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class CachedTop:
+    total: asyncio.Task
+    pages: QueryPageCache
+
+
 class OwoCounter(commands.GroupCog):
     def __init__(self, bot: LXVBot):
         self.bot = bot
         self.cooldown_config = self.bot.config.cooldown
-        self.cooldowns: dict[str, Tuple[datetime.datetime, asyncio.Task]] = {}
+        self.cooldowns: utils.ExpiringDict[str, datetime.datetime] = utils.ExpiringDict()
         self.remind_cds: dict[int, asyncio.Task] = {}
-        self.lock = set()
+        self.point_cooldown = self.bot.redis.register_script(POINT_COOLDOWN_SCRIPT)
+        self.classifier = utils.CommandClassifier((self.bot.config.owo_prefix, "owo"))
         self._cd = commands.CooldownMapping.from_cooldown(rate=1.0, per=3.0, type=commands.BucketType.user)
+        # Keyed by (stat column, (start_id, end_id) or None for all time)
+        self._top_cache: utils.TTLCache[Tuple[str, Optional[Tuple[int, int]]], CachedTop] = utils.TTLCache(
+            maxsize=64, ttl=TOP_CACHE_TTL
+        )
+        self.bot.metrics.add_cache("owo_top", self._top_cache)
+
+    async def cog_load(self):
+        self.bot.stat_writer.add_listener(self.invalidate_top_cache)
+        self.check_leaderboard.start()
+        self.sweep_cooldowns.start()
 
-        self.owo_stat_ids = LRUCache()
+    async def cog_unload(self):
+        self.bot.stat_writer.remove_listener(self.invalidate_top_cache)
+        self.check_leaderboard.cancel()
+        self.sweep_cooldowns.cancel()
 
     def cog_check(self, ctx: commands.Context):  # type: ignore
         if ctx.guild is None or ctx.guild.id != self.bot.config.guild_id:
@@ -53,36 +110,12 @@ class OwoCounter(commands.GroupCog):
     # region Commands
     def get_command(
         self, content: str, interaction: Optional[discord.MessageInteraction] = None
-    ) -> Optional[Tuple[OwOCommand, list[str]]]:
+    ) -> Optional[Tuple[OwOCommand, str]]:
         # NOTE: Might be deprecated in future
         if interaction is not None:
-            args = [interaction.name]
-        else:
-            content = content.lower()
-            if content.startswith(self.bot.config.owo_prefix):
-                args = list(filter(lambda s: s.strip(), content.removeprefix(self.bot.config.owo_prefix).split()))
-            elif content.startswith("owo"):
-                args = list(filter(lambda s: s.strip(), content.removeprefix("owo").split()))
-            else:
-                # Not a command, check if there is owo in message
-                if "owo" in content or "uwu" in content:
-                    return OwOCommand.POINT, []
-                return None
-
-        command = args[0] if args else "owo"
-        args = args[1:] if len(args) > 1 else []
-        if command in {"h", "hunt", "catch"}:
-            return OwOCommand.HUNT, args
-        elif command in {"b", "battle", "fight"}:
-            return OwOCommand.BATTLE, args
-        elif command == "pray":
-            return OwOCommand.PRAY, args
-        elif command == "curse":
-            return OwOCommand.CURSE, args
-        elif command == "owo":
-            return OwOCommand.POINT, args
-        else:
-            return None
+            command = self.classifier.classify_name(interaction.name)
+            return (command, "") if command is not None else None
+        return self.classifier.classify(content)
 
     @asynccontextmanager
     async def get_lock(self, locks: dict[int, asyncio.Lock], key_id: int):
@@ -104,40 +137,29 @@ class OwoCounter(commands.GroupCog):
             if key_id in locks and not locks[key_id].locked():
                 del locks[key_id]
 
-    async def remove_cd(self, key: str, start_time: datetime.datetime, cd: float):
-        await discord.utils.sleep_until(start_time + datetime.timedelta(seconds=cd))
-        if key in self.cooldowns and self.cooldowns[key][0] == start_time:  # Check if datetime is equal
-            del self.cooldowns[key]
+    @tasks.loop(minutes=1)
+    async def sweep_cooldowns(self):
+        removed = self.cooldowns.expire(discord.utils.utcnow().timestamp())
+        if removed:
+            logger.debug("Removed %s expired cooldown(s)", removed)
 
     # region Cooldown
     async def cooldown_check(self, command: OwOCommand, message: discord.Message) -> bool:
         key = f"cd_{command}_{message.author.id}"
-        if key in self.lock:
-            return False
-
-        self.lock.add(key)
         try:
             now = discord.utils.snowflake_time(message.id)
             if command == OwOCommand.POINT:
-                last = await self.bot.redis.get(key)
-                if last is None:
-                    last = datetime.datetime(2020, 1, 1, tzinfo=zoneinfo.ZoneInfo("UTC"))
-                else:
-                    last = datetime.datetime.fromisoformat(last)
-
-                diff = (now - last).total_seconds()
-                if diff < self.cooldown_config.owo:
-                    # Future cooldown
-                    if diff > -self.cooldown_config.max_owo_penalty:
-                        new_time = last + datetime.timedelta(seconds=self.cooldown_config.owo_penalty)
-                        await self.bot.redis.set(
-                            key, new_time.isoformat(), exat=new_time + datetime.timedelta(seconds=self.cooldown_config.owo)
-                        )
-                    return False
-
-                await self.bot.redis.set(
-                    key, now.isoformat(), exat=now + datetime.timedelta(seconds=self.cooldown_config.owo)
+                counted = await self.point_cooldown(
+                    keys=[key],
+                    args=[
+                        int(now.timestamp() * 1000),
+                        int(self.cooldown_config.owo * 1000),
+                        int(self.cooldown_config.owo_penalty * 1000),
+                        int(self.cooldown_config.max_owo_penalty * 1000),
+                    ],
                 )
+                if not counted:
+                    return False
             else:
                 match command:
                     case OwOCommand.HUNT:
@@ -151,67 +173,34 @@ class OwoCounter(commands.GroupCog):
                     case _:
                         raise ValueError(f"Unknown command {command}")
 
-                if key in self.cooldowns and (now - self.cooldowns[key][0]).total_seconds() < cd:
+                # Entries expire once the cooldown is over
+                if self.cooldowns.get(key, now.timestamp()) is not None:
                     return False
 
-                self.cooldowns[key] = (now, self.bot.loop.create_task(self.remove_cd(key, now, cd)))
+                self.cooldowns.set(key, now, now.timestamp() + cd)
         except Exception as e:
             logger.error(f"Error while checking cooldown for {command}", exc_info=e)
             await self.bot.send_error_to_owner(e, message.channel, command.value)  # type: ignore
             return False
-        finally:
-            self.lock.remove(key)
 
         return True
 
     # region Counter
     async def process_stat(
-        self, message: discord.Message, command: OwOCommand, args: list[str], *, as_member: Optional[discord.Member] = None
+        self, message: discord.Message, command: OwOCommand, args: str, *, as_member: Optional[discord.Member] = None
     ):
         now = discord.utils.snowflake_time(message.id)
         now_id = self.bot.get_day_id(now)
-        key = f"{message.author.id}_{now_id}"
         member: discord.Member = as_member or message.author  # type: ignore
-        logger.debug("Processing stat for %s", key)
+        logger.debug("Processing stat for %s_%s", member.id, now_id)
 
-        async with self.bot.lasync_session() as session:
-            async with session.begin():
-                stat_id = self.owo_stat_ids.get(key)
-                if stat_id is None:
-                    cursor = await session.execute(
-                        select(models.OwOStat).where(models.OwOStat.user_id == member.id).where(models.OwOStat.day == now_id)
-                    )
-                    stat = cursor.scalar_one_or_none()
-                    if stat is None:
-                        stat = models.OwOStat(
-                            day=now_id,
-                            user_id=member.id,
-                            owo_count=0,
-                            hunt_count=0,
-                            battle_count=0,
-                            pray_count=0,
-                            curse_count=0,
-                        )
-                        session.add(stat)
-                        await session.flush()
-
-                    stat_id = stat.id
-
-                update_stmt = update(models.OwOStat).where(models.OwOStat.id == stat_id)
-                match command:
-                    case OwOCommand.POINT:
-                        update_stmt = update_stmt.values(owo_count=models.OwOStat.owo_count + 1)
-                    case OwOCommand.HUNT:
-                        update_stmt = update_stmt.values(hunt_count=models.OwOStat.hunt_count + 1)
-                    case OwOCommand.BATTLE:
-                        update_stmt = update_stmt.values(battle_count=models.OwOStat.battle_count + 1)
-                    case OwOCommand.PRAY:
-                        update_stmt = update_stmt.values(pray_count=models.OwOStat.pray_count + 1)
-                    case OwOCommand.CURSE:
-                        update_stmt = update_stmt.values(curse_count=models.OwOStat.curse_count + 1)
-                    case _:
-                        raise ValueError(f"Unknown stat command {command}")
-                await session.execute(update_stmt)
+        column = STAT_COLUMN_BY_COMMAND.get(command)
+        if column is None:
+            raise ValueError(f"Unknown stat command {command}")
+        if self.bot.stat_buffer is None:
+            await self.bot.stat_writer.increment(member.id, now_id, column)
+        else:
+            self.bot.stat_buffer.add(member.id, now_id, column)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -259,17 +248,19 @@ class OwoCounter(commands.GroupCog):
         if not confirm.value:
             return
 
-        async with self.bot.lasync_session() as session:
-            async with session.begin():
-                await session.execute(delete(models.OwOStat).where(models.OwOStat.user_id == member.id))
-
-                await ctx.reply(
-                    embed=discord.Embed(
-                        title="OwO Reset",
-                        color=discord.Color.green(),
-                        description=f"Successfully reset OwO statistics for {member.mention}",
-                    )
-                )
+        # Write pending increments first so they don't reappear after the reset
+        if self.bot.stat_buffer is not None:
+            await self.bot.stat_buffer.flush()
+        await self.bot.stat_writer.reset_user(member.id, self.bot.get_day_id(discord.utils.utcnow()))
+        self._top_cache.clear()
+
+        await ctx.reply(
+            embed=discord.Embed(
+                title="OwO Reset",
+                color=discord.Color.green(),
+                description=f"Successfully reset OwO statistics for {member.mention}",
+            )
+        )
 
     @commands.hybrid_command(name="stat", aliases=["s"])
     async def stat(self, ctx: commands.Context, member: Optional[discord.Member] = None):
@@ -280,159 +271,43 @@ class OwoCounter(commands.GroupCog):
 
         # Calculate day IDs for different periods
         yesterday_id = now_id - 1
-        week_start_id = self.bot.get_day_id(now - datetime.timedelta(days=now.weekday() + 1))
-        prev_week_end_id = week_start_id - 1
-        prev_week_start_id = week_start_id - 7
-        month_start_id = self.bot.get_day_id(now.replace(day=1))
-        prev_month_end_id = month_start_id - 1
-        prev_month_start_id = self.bot.get_day_id(utils.date.add_months(now.replace(day=1), -1))
-        year_start_id = self.bot.get_day_id(now.replace(month=1, day=1))
+        week_start_id = utils.date.week_start_day(now_id)
+        month_start_id = utils.date.month_start_day(now_id)
+        periods = {
+            "week": (StatPeriod.WEEK, week_start_id),
+            "prev_week": (StatPeriod.WEEK, week_start_id - 7),
+            "month": (StatPeriod.MONTH, month_start_id),
+            "prev_month": (StatPeriod.MONTH, utils.date.month_start_day(month_start_id - 1)),
+            "year": (StatPeriod.YEAR, utils.date.year_start_day(now_id)),
+        }
 
         async with self.bot.lasync_session() as session:
             async with session.begin():
-                # Query for today's stats (single record)
-                today_query = select(models.OwOStat).where(models.OwOStat.user_id == user.id, models.OwOStat.day == now_id)
-                today_result = await session.execute(today_query)
-                today_stat = today_result.scalar_one_or_none()
-                if today_stat is None:
-                    today_stat = models.OwOStat(
-                        day=now_id,
-                        user_id=user.id,
-                        owo_count=0,
-                        hunt_count=0,
-                        battle_count=0,
-                        pray_count=0,
-                        curse_count=0,
-                    )
-
-                # Query for yesterday's stats
-                yesterday_query = select(models.OwOStat).where(
-                    models.OwOStat.user_id == user.id, models.OwOStat.day == yesterday_id
-                )
-                yesterday_result = await session.execute(yesterday_query)
-                yesterday_stat = yesterday_result.scalar_one_or_none()
-                if yesterday_stat is None:
-                    yesterday_stat = models.OwOStat(
-                        day=yesterday_id,
-                        user_id=user.id,
-                        owo_count=0,
-                        hunt_count=0,
-                        battle_count=0,
-                        pray_count=0,
-                        curse_count=0,
-                    )
-
-                all_time_query = select(
-                    func.coalesce(func.sum(models.OwOStat.owo_count), 0).label("owo_count"),
-                    func.coalesce(func.sum(models.OwOStat.hunt_count), 0).label("hunt_count"),
-                    func.coalesce(func.sum(models.OwOStat.battle_count), 0).label("battle_count"),
-                    func.coalesce(func.sum(models.OwOStat.pray_count), 0).label("pray_count"),
-                    func.coalesce(func.sum(models.OwOStat.curse_count), 0).label("curse_count"),
-                ).where(models.OwOStat.user_id == user.id)
-                all_time = await session.execute(all_time_query)
-                all_time_stat = all_time.one_or_none()
-                if all_time_stat is None:
-                    all_time_stat = models.OwOStat(
-                        day=0,
-                        user_id=user.id,
-                        owo_count=0,
-                        hunt_count=0,
-                        battle_count=0,
-                        pray_count=0,
-                        curse_count=0,
+                day_result = await session.execute(
+                    select(models.OwOStat).where(
+                        models.OwOStat.user_id == user.id, models.OwOStat.day.in_([now_id, yesterday_id])
                     )
-
-                # -------------------------------- Aggregates -------------------------------- #
-                period_queries = []
-
-                # Current week aggregation
-                week_query = (
-                    select(
-                        literal_column("'week'").label("period"),
-                        func.coalesce(func.sum(models.OwOStat.owo_count), 0).label("owo_count"),
-                        func.coalesce(func.sum(models.OwOStat.hunt_count), 0).label("hunt_count"),
-                        func.coalesce(func.sum(models.OwOStat.battle_count), 0).label("battle_count"),
-                        func.coalesce(func.sum(models.OwOStat.pray_count), 0).label("pray_count"),
-                        func.coalesce(func.sum(models.OwOStat.curse_count), 0).label("curse_count"),
-                    )
-                    .where(models.OwOStat.user_id == user.id, models.OwOStat.day.between(week_start_id, now_id))
-                    .group_by("period")
-                )
-                period_queries.append(week_query)
-
-                # Previous week aggregation
-                prev_week_query = (
-                    select(
-                        literal_column("'prev_week'").label("period"),
-                        func.coalesce(func.sum(models.OwOStat.owo_count), 0).label("owo_count"),
-                        func.coalesce(func.sum(models.OwOStat.hunt_count), 0).label("hunt_count"),
-                        func.coalesce(func.sum(models.OwOStat.battle_count), 0).label("battle_count"),
-                        func.coalesce(func.sum(models.OwOStat.pray_count), 0).label("pray_count"),
-                        func.coalesce(func.sum(models.OwOStat.curse_count), 0).label("curse_count"),
-                    )
-                    .where(
-                        models.OwOStat.user_id == user.id,
-                        models.OwOStat.day.between(prev_week_start_id, prev_week_end_id),
-                    )
-                    .group_by("period")
-                )
-                period_queries.append(prev_week_query)
-
-                # Add similar queries for month and year stats
-                # Month query
-                month_query = (
-                    select(
-                        literal_column("'month'").label("period"),
-                        func.coalesce(func.sum(models.OwOStat.owo_count), 0).label("owo_count"),
-                        func.coalesce(func.sum(models.OwOStat.hunt_count), 0).label("hunt_count"),
-                        func.coalesce(func.sum(models.OwOStat.battle_count), 0).label("battle_count"),
-                        func.coalesce(func.sum(models.OwOStat.pray_count), 0).label("pray_count"),
-                        func.coalesce(func.sum(models.OwOStat.curse_count), 0).label("curse_count"),
-                    )
-                    .where(models.OwOStat.user_id == user.id, models.OwOStat.day.between(month_start_id, now_id))
-                    .group_by("period")
-                )
-                period_queries.append(month_query)
-
-                # Previous month query
-                prev_month_query = (
-                    select(
-                        literal_column("'prev_month'").label("period"),
-                        func.coalesce(func.sum(models.OwOStat.owo_count), 0).label("owo_count"),
-                        func.coalesce(func.sum(models.OwOStat.hunt_count), 0).label("hunt_count"),
-                        func.coalesce(func.sum(models.OwOStat.battle_count), 0).label("battle_count"),
-                        func.coalesce(func.sum(models.OwOStat.pray_count), 0).label("pray_count"),
-                        func.coalesce(func.sum(models.OwOStat.curse_count), 0).label("curse_count"),
-                    )
-                    .where(
-                        models.OwOStat.user_id == user.id,
-                        models.OwOStat.day.between(prev_month_start_id, prev_month_end_id),
-                    )
-                    .group_by("period")
                 )
-                period_queries.append(prev_month_query)
-
-                # Year query
-                year_query = (
-                    select(
-                        literal_column("'year'").label("period"),
-                        func.coalesce(func.sum(models.OwOStat.owo_count), 0).label("owo_count"),
-                        func.coalesce(func.sum(models.OwOStat.hunt_count), 0).label("hunt_count"),
-                        func.coalesce(func.sum(models.OwOStat.battle_count), 0).label("battle_count"),
-                        func.coalesce(func.sum(models.OwOStat.pray_count), 0).label("pray_count"),
-                        func.coalesce(func.sum(models.OwOStat.curse_count), 0).label("curse_count"),
+                day_stats = {row.day: row for row in day_result.scalars()}
+
+                rollup_result = await session.execute(
+                    select(models.OwOStatRollup).where(
+                        models.OwOStatRollup.user_id == user.id,
+                        tuple_(models.OwOStatRollup.period, models.OwOStatRollup.start_day).in_(
+                            [(period.value, start_day) for period, start_day in periods.values()]
+                            + [(StatPeriod.ALL_TIME.value, 0)]
+                        ),
                     )
-                    .where(models.OwOStat.user_id == user.id, models.OwOStat.day.between(year_start_id, now_id))
-                    .group_by("period")
                 )
-                period_queries.append(year_query)
+                rollups = {(row.period, row.start_day): row for row in rollup_result.scalars()}
 
-                # Use SQLAlchemy's union() to combine all queries
-                combined_query = union_all(*period_queries)
-
-                # Execute the combined query
-                period_result = await session.execute(combined_query)
-                period_stats = {row.period: row for row in period_result}
+        empty_stat = models.OwOStat(owo_count=0, hunt_count=0, battle_count=0, pray_count=0, curse_count=0)
+        today_stat = day_stats.get(now_id, empty_stat)
+        yesterday_stat = day_stats.get(yesterday_id, empty_stat)
+        all_time_stat = rollups.get((StatPeriod.ALL_TIME.value, 0), empty_stat)
+        period_stats = {
+            period_name: rollups.get((period.value, start_day)) for period_name, (period, start_day) in periods.items()
+        }
 
         embed = discord.Embed(title="OwO Statistics", colour=discord.Colour.random())
         all_time_text = (
@@ -505,19 +380,18 @@ class OwoCounter(commands.GroupCog):
         """View the Curse leaderboard"""
         await self._show_top(ctx, OwOCommand.CURSE, period)
 
-    async def format_lb(self, stat_field: str, top_type: str):
+    async def format_lb(self, top_type: str):
         guild_id = self.bot.config.guild_id
         guild = self.bot.get_guild(guild_id) or await self.bot.fetch_guild(guild_id)
 
         def formatter(source: menus.ListPageSource, menu: menus.MenuPages, page):
             res = []
-            for index, row in enumerate(page):
-                member_id = row.user_id
+            for index, (member_id, count) in enumerate(page):
                 member = guild.get_member(member_id)
                 if member is None:
-                    output = f"<@{member_id}> - **{getattr(row, f'{stat_field}_count')}** {top_type}(s)"
+                    output = f"<@{member_id}> - **{count}** {top_type}(s)"
                 else:
-                    output = f"{member.name} - **{getattr(row, f'{stat_field}_count')}** {top_type}(s) ||{member.mention}||"
+                    output = f"{member.name} - **{count}** {top_type}(s) ||{member.mention}||"
                 res.append(f"**{index + 1 + (menu.current_page * 10)}.** {output}")
 
             return "\n".join(res)
@@ -525,36 +399,24 @@ class OwoCounter(commands.GroupCog):
         return formatter
 
     async def _show_top(self, ctx: commands.Context, stat_type: OwOCommand, period: Optional[str] = None):
-        q = select(models.OwOStat.user_id).group_by(models.OwOStat.user_id)
-
         top_type = None
 
         if stat_type == OwOCommand.POINT:
-            field = models.OwOStat.owo_count
             top_type = "OwO"
-            stat_field = "owo"
         elif stat_type == OwOCommand.HUNT:
-            field = models.OwOStat.hunt_count
             top_type = "Hunt"
-            stat_field = "hunt"
         elif stat_type == OwOCommand.BATTLE:
-            field = models.OwOStat.battle_count
             top_type = "Battle"
-            stat_field = "battle"
         elif stat_type == OwOCommand.PRAY:
-            field = models.OwOStat.pray_count
             top_type = "Pray"
-            stat_field = "pray"
         elif stat_type == OwOCommand.CURSE:
-            field = models.OwOStat.curse_count
             top_type = "Curse"
-            stat_field = "curse"
         else:
-            field = models.OwOStat.owo_count
+            stat_type = OwOCommand.POINT
             top_type = "OwO"
-            stat_field = "owo"
 
-        q = q.add_columns(func.sum(field).label(f"{stat_field}_count"))
+        column = STAT_COLUMN_BY_COMMAND[stat_type]
+        field = getattr(models.OwOStat, column)
 
         now = discord.utils.snowflake_time(ctx.message.id)
         now_id = self.bot.get_day_id(now)
@@ -564,23 +426,31 @@ class OwoCounter(commands.GroupCog):
             period = "alltime"
         period = period.lower()
 
+        # Periods with a live leaderboard bucket, (start_id, end_id) of None means all time
+        bucket = None
+        day_range = None
         if period in {"d", "day", "daily"}:
-            q = q.where(models.OwOStat.day == now_id)
+            bucket = (utils.DAY_BUCKET, now_id)
+            day_range = (now_id, now_id)
             top_period = "Daily"
         elif period in {"y", "yesterday"}:
-            q = q.where(models.OwOStat.day == now_id - 1)
+            bucket = (utils.DAY_BUCKET, now_id - 1)
+            day_range = (now_id - 1, now_id - 1)
             top_period = "Yesterday"
         elif period in {"w", "week", "weekly"}:
-            week_start_id = self.bot.get_day_id(now - datetime.timedelta(days=now.weekday() + 1))
-            q = q.where(models.OwOStat.day.between(week_start_id, now_id))
+            week_start_id = utils.date.week_start_day(now_id)
+            bucket = (StatPeriod.WEEK.value, week_start_id)
+            day_range = (week_start_id, now_id)
             top_period = "Weekly"
         elif period in {"m", "month", "monthly"}:
-            month_start_id = self.bot.get_day_id(now.replace(day=1))
-            q = q.where(models.OwOStat.day.between(month_start_id, now_id))
+            month_start_id = utils.date.month_start_day(now_id)
+            bucket = (StatPeriod.MONTH.value, month_start_id)
+            day_range = (month_start_id, now_id)
             top_period = "Monthly"
         elif period in {"year", "yearly"}:
-            year_start_id = self.bot.get_day_id(now.replace(month=1, day=1))
-            q = q.where(models.OwOStat.day.between(year_start_id, now_id))
+            year_start_id = utils.date.year_start_day(now_id)
+            bucket = (StatPeriod.YEAR.value, year_start_id)
+            day_range = (year_start_id, now_id)
             top_period = "Yearly"
         elif period != "alltime":
             # Try to parse the period as a date
@@ -598,10 +468,7 @@ class OwoCounter(commands.GroupCog):
                     end_date = start_date
                     top_period = discord.utils.format_dt(start_date, 'D')
 
-                start_id = self.bot.get_day_id(start_date)
-                end_id = self.bot.get_day_id(end_date)
-
-                q = q.where(models.OwOStat.day.between(start_id, end_id))
+                day_range = (self.bot.get_day_id(start_date), self.bot.get_day_id(end_date))
             except ValueError:
                 await ctx.reply(
                     embed=discord.Embed(
@@ -614,25 +481,94 @@ class OwoCounter(commands.GroupCog):
 
         else:
             # No period specified, default to all time
-            q = q.select_from(models.OwOStat)
+            bucket = (StatPeriod.ALL_TIME.value, 0)
             top_period = "All Time"
 
-        async with self.bot.lasync_session() as session:
-            total_q = await session.execute(q.with_only_columns(func.sum(field)).group_by(None))
-            total = total_q.scalar_one_or_none() or 0
-
         embed = discord.Embed(title=f"Top {top_period} {top_type}", color=discord.Color.random())
+        formatter = await self.format_lb(top_type)
+
+        leaderboard_ready = False
+        if bucket is not None:
+            try:
+                leaderboard_ready = await self.bot.leaderboard.is_ready()
+            except Exception as e:
+                logger.warning("Leaderboard unavailable, falling back to database", exc_info=e)
+
+        if leaderboard_ready:
+            total = await self.bot.leaderboard.total(column, *bucket)  # type: ignore
+            source = LeaderboardSource(self.bot.leaderboard, column, *bucket, formatter, embed)  # type: ignore
+        else:
+            q = select(models.OwOStat.user_id, func.sum(field).label(column)).group_by(models.OwOStat.user_id)
+            if day_range is not None:
+                q = q.where(models.OwOStat.day.between(*day_range))
+
+            cached = self.get_cached_top(column, day_range, q.with_only_columns(func.sum(field)).group_by(None))
+            try:
+                total = await asyncio.shield(cached.total)
+            except Exception:
+                self._top_cache.invalidate((column, day_range))
+                raise
+
+            source = QueryEmbedSource(
+                q,
+                func.sum(field).desc(),
+                self.bot.lasync_session,
+                formatter,
+                embed,
+                keyset=(column, "user_id"),
+                cache=cached.pages,
+            )
+
         embed.add_field(name="Total", value=f"**{total}** {top_type}(s)")
-        source = QueryEmbedSource(
-            q,
-            func.sum(field).desc(),
-            self.bot.lasync_session,
-            await self.format_lb(stat_field, top_type),
-            embed,
-        )
         page = SimplePages(source)
         await page.start(ctx)
 
+    def get_cached_top(self, column: str, day_range: Optional[Tuple[int, int]], total_query) -> CachedTop:
+        """
+        Shared state of a leaderboard query, identical requests within ``TOP_CACHE_TTL`` reuse
+        the same total and pages (including the ones still loading)
+        """
+        cached = self._top_cache.get((column, day_range))
+        if cached is None:
+            cached = CachedTop(asyncio.create_task(self._query_total(total_query)), QueryPageCache())
+            self._top_cache.set((column, day_range), cached)
+        return cached
+
+    async def _query_total(self, total_query) -> int:
+        async with self.bot.lasync_session() as session:
+            total_q = await session.execute(total_query)
+            return total_q.scalar_one_or_none() or 0
+
+    def invalidate_top_cache(self, deltas: Mapping[Tuple[int, int], Dict[str, int]]):
+        days = {day for _, day in deltas}
+        # Menus already showing it keep their snapshot, new requests query again
+        self._top_cache.invalidate_where(lambda key: key[1] is None or any(key[1][0] <= day <= key[1][1] for day in days))
+
+    @commands.command(name="lbrebuild", hidden=True)
+    @commands.is_owner()
+    async def rebuild_leaderboard(self, ctx: commands.Context):
+        """
+        Rebuild live leaderboards from the database
+        """
+        async with ctx.typing():
+            await self.rebuild_leaderboard_now(discord.utils.snowflake_time(ctx.message.id))
+        await ctx.reply("Leaderboards rebuilt", mention_author=False)
+
+    async def rebuild_leaderboard_now(self, now: datetime.datetime):
+        # Pending increments have to be in the database before it is read
+        if self.bot.stat_buffer is not None:
+            await self.bot.stat_buffer.flush()
+        await self.bot.stat_writer.rebuild_leaderboard(self.bot.get_day_id(now))
+
+    @tasks.loop(minutes=5)
+    async def check_leaderboard(self):
+        try:
+            if not await self.bot.leaderboard.is_ready():
+                logger.info("Leaderboards not ready, rebuilding")
+                await self.rebuild_leaderboard_now(discord.utils.utcnow())
+        except Exception as e:
+            logger.error("Failed to rebuild leaderboards", exc_info=e)
+
     @commands.command(hidden=True)
     async def _ocd(self, ctx: commands.Context, member: Optional[discord.Member] = None):
         user: discord.Member = member or ctx.author  # type: ignore
@@ -642,8 +578,15 @@ class OwoCounter(commands.GroupCog):
             await ctx.send("Safe")
             return
 
+        try:
+            last_ms = int(val)
+        except ValueError:
+            # ISO string from before epoch milliseconds, the cooldown script treats it as expired
+            await ctx.send("Safe (legacy value)")
+            return
+
         now = discord.utils.snowflake_time(ctx.message.id)
-        last = datetime.datetime.fromisoformat(val)
+        last = datetime.datetime.fromtimestamp(last_ms / 1000, tz=datetime.timezone.utc)
         diff = (now - last).total_seconds()
 
         await ctx.send(f"{discord.utils.format_dt(last, 'R')} ({diff}s{' ⚠️' if diff < 0 else ''})")
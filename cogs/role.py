@@ -1,16 +1,16 @@
 from __future__ import annotations
-from io import BytesIO
 import logging
-from typing import TYPE_CHECKING, Dict, Optional
+from typing import TYPE_CHECKING, AbstractSet, Dict, Iterable, Optional, Set, Tuple
 
 import discord
 from discord.ext import commands, tasks
-import discord.http
-from sqlalchemy import JSON, bindparam, func, select, delete, text
+from sqlalchemy import select, delete
 
 import check
 import consts
+from enums.action_priority import ActionPriority
 import models
+import utils
 from utils.view_util import ConfirmEmbed
 
 if TYPE_CHECKING:
@@ -18,22 +18,135 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+ATTACHMENT_ICON_TYPES = frozenset({"image/png", "image/jpeg"})
+
+
+class CustomRoleIndex:
+    """
+    Mapping of user to custom role with the reverse role to users lookup
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, int]] = ()) -> None:
+        self.role_by_user: Dict[int, int] = {}
+        self.users_by_role: Dict[int, Set[int]] = {}
+        for user_id, role_id in rows:
+            self.set(user_id, role_id)
+
+    def __len__(self) -> int:
+        return len(self.role_by_user)
+
+    def get(self, user_id: int) -> Optional[int]:
+        return self.role_by_user.get(user_id)
+
+    def users(self, role_id: int) -> Set[int]:
+        return self.users_by_role.get(role_id, set())
+
+    def set(self, user_id: int, role_id: int):
+        self.remove(user_id)
+        self.role_by_user[user_id] = role_id
+        self.users_by_role.setdefault(role_id, set()).add(user_id)
+
+    def remove(self, user_id: int) -> Optional[int]:
+        role_id = self.role_by_user.pop(user_id, None)
+        if role_id is not None:
+            users = self.users_by_role[role_id]
+            users.discard(user_id)
+            if not users:
+                del self.users_by_role[role_id]
+        return role_id
+
 
 class Role(commands.GroupCog, group_name="customrole"):
     def __init__(self, bot: LXVBot):
         self.bot = bot
-        self._custom_role_cache: Dict[int, int] = {}
+        self.custom_roles = CustomRoleIndex()
+        # Falls back to per user queries until the mapping has been loaded once
+        self._custom_roles_loaded = False
+        # Bumped on every write-through, a load racing with a write is discarded
+        self._custom_roles_version = 0
+        # Database lookups until the index is loaded, users without a role are remembered too
+        self._custom_role_fallback: utils.TTLCache[int, int] = utils.TTLCache(maxsize=1024, ttl=60, negative_ttl=60)
+        self.bot.metrics.add_cache("custom_role_fallback", self._custom_role_fallback)
 
     def cog_check(self, ctx: commands.Context):
         return ctx.guild is not None and ctx.guild.id == consts.GUILD_ID
 
     async def cog_load(self):
-        self.refresh_cache.start()
+        try:
+            # Warm from redis, the first reconcile compares it with the database
+            await self.load_custom_roles(refresh=False)
+        except Exception as e:
+            logger.error("Failed to load custom roles, retrying on next reconcile", exc_info=e)
+        self.bot.settings.add_listener(self._reload_custom_roles)
+        self.reconcile_custom_roles.start()
         self.report_roles.start()
 
-    @tasks.loop(seconds=60)
-    async def refresh_cache(self):
-        self._custom_role_cache = {}
+    async def cog_unload(self):
+        self.bot.settings.remove_listener(self._reload_custom_roles)
+        self.reconcile_custom_roles.cancel()
+        self.report_roles.cancel()
+
+    async def load_custom_roles(self, *, refresh: bool = True) -> bool:
+        """
+        Replace the index from the database, or from the shared settings cache without ``refresh``
+        """
+        version = self._custom_roles_version
+        if refresh:
+            rows = await self._query_custom_roles()
+        else:
+            rows = await self.bot.settings.get_or_load("custom_roles", self._query_custom_roles)
+        index = CustomRoleIndex((user_id, role_id) for user_id, role_id in rows)
+
+        if version != self._custom_roles_version:
+            logger.debug("Custom roles changed while loading, keeping current index")
+            return False
+
+        if refresh and (not self._custom_roles_loaded or index.role_by_user != self.custom_roles.role_by_user):
+            if self._custom_roles_loaded:
+                logger.warning("Custom role index was out of sync with the database")
+            await self.bot.settings.set("custom_roles", rows)
+        self.custom_roles = index
+        self._custom_roles_loaded = True
+        self._custom_role_fallback.clear()
+        logger.info("Loaded %s custom role(s)", len(index))
+        return True
+
+    async def _query_custom_roles(self) -> list[tuple[int, int]]:
+        async with self.bot.async_session() as session:
+            cursor = await session.execute(select(models.CustomRole.user_id, models.CustomRole.role_id))
+            return sorted(cursor.tuples())
+
+    async def _reload_custom_roles(self, key: Optional[str]):
+        # Written by another process
+        if key in {"custom_roles", None}:
+            await self.load_custom_roles(refresh=False)
+
+    async def set_custom_role(self, user_id: int, role_id: Optional[int]):
+        if role_id is None:
+            self.custom_roles.remove(user_id)
+        else:
+            self.custom_roles.set(user_id, role_id)
+        self._custom_roles_version += 1
+        self._custom_role_fallback.invalidate(user_id)
+        try:
+            if self._custom_roles_loaded:
+                await self.bot.settings.set("custom_roles", sorted(self.custom_roles.role_by_user.items()))
+            else:
+                # Only part of the mapping is known, the next load reads the database
+                await self.bot.settings.invalidate("custom_roles")
+        except Exception as e:
+            # Database has the change, the stale redis copy expires with the settings ttl
+            logger.error("Failed to share custom role of %s", user_id, exc_info=e)
+
+    @tasks.loop(minutes=10)
+    async def reconcile_custom_roles(self):
+        # Catches changes made outside of the bot, commands keep the index current otherwise
+        await self.load_custom_roles()
+
+    @reconcile_custom_roles.before_loop
+    async def before_reconcile_custom_roles(self):
+        # Loaded in cog_load already
+        await self.bot.wait_until_ready()
 
     @tasks.loop(hours=12)
     async def report_roles(self):
@@ -41,21 +154,8 @@ class Role(commands.GroupCog, group_name="customrole"):
         ch = guild.get_channel(765818685922213948)  # type: ignore
         if ch is None:
             return await self.bot.send_owner(f"Your lxv channel is missing. Previously channel id {765818685922213948}")
-        async with self.bot.async_session() as session:
-            cursor = await session.execute(select(func.count(models.CustomRole.user_id)))
-            count = cursor.scalar()
-
-        async with self.bot.engine.connect() as conn:
-            await conn.execute(
-                text("INSERT INTO health_reports (data, created_at) VALUES (:data, NOW())")
-                .bindparams(
-                    bindparam("data", value={"total_custom_roles": count}, type_=JSON),
-                )
-            )
-            await conn.execute(
-                text("DELETE FROM health_reports WHERE created_at < NOW() - INTERVAL '7 DAY'")
-            )
-            await conn.commit()
+        # Samples are recorded by the health cog
+        count = len(self.custom_roles)
 
         await ch.send(f"Total custom roles: {count}")  # type: ignore
 
@@ -64,18 +164,14 @@ class Role(commands.GroupCog, group_name="customrole"):
         await self.bot.wait_until_ready()
 
     async def retrieve_custom_role_id(self, member_id: int) -> Optional[int]:
-        if member_id in self._custom_role_cache:
-            return self._custom_role_cache[member_id]
+        if self._custom_roles_loaded:
+            return self.custom_roles.get(member_id)
+        return await self._custom_role_fallback.get_or_load(member_id, lambda: self._query_custom_role_id(member_id))
 
+    async def _query_custom_role_id(self, member_id: int) -> Optional[int]:
         async with self.bot.async_session() as session:
-            async with session.begin():
-                cursor = await session.execute(select(models.CustomRole).where(models.CustomRole.user_id == member_id))
-                cur_role = cursor.scalar_one_or_none()
-                if cur_role is not None:
-                    self._custom_role_cache[member_id] = cur_role.role_id
-                    return cur_role.role_id
-
-        return None
+            cursor = await session.execute(select(models.CustomRole.role_id).where(models.CustomRole.user_id == member_id))
+            return cursor.scalar_one_or_none()
 
     @commands.command(name="createrole", aliases=["cr"])
     @check.is_mod()
@@ -103,7 +199,8 @@ class Role(commands.GroupCog, group_name="customrole"):
                 session.add(models.CustomRole(user_id=member.id, role_id=role.id))
 
                 await role.edit(position=divider.position - 1)
-                await member.add_roles(role)
+                await self.bot.action_queue.edit_member_roles(member, {role.id: True}, priority=ActionPriority.INTERACTIVE)
+        await self.set_custom_role(member.id, role.id)
 
         await ctx.reply(
             f"Created & assigned role {role.mention} for user {member.mention}",
@@ -131,10 +228,13 @@ class Role(commands.GroupCog, group_name="customrole"):
             async with session.begin():
                 await session.execute(delete(models.CustomRole).where(models.CustomRole.user_id == member.id))
                 if role:
-                    await member.remove_roles(role) 
+                    await self.bot.action_queue.edit_member_roles(
+                        member, {role.id: False}, priority=ActionPriority.INTERACTIVE
+                    )
 
                 if delete_role and role is not None:
                     await role.delete(reason=f"Deletion custom role by {ctx.author.name} ({ctx.author.id})")
+        await self.set_custom_role(member.id, None)
 
         await ctx.reply(
             f"{'Deleted' if delete_role else 'Removed'} role @{role.name if role else 'Unknown Role'} from user {member.mention}",
@@ -169,9 +269,9 @@ class Role(commands.GroupCog, group_name="customrole"):
                     cur_role = models.CustomRole(user_id=member.id, role_id=role.id)
 
                 session.add(cur_role)
-                await member.add_roles(role)
+                await self.bot.action_queue.edit_member_roles(member, {role.id: True}, priority=ActionPriority.INTERACTIVE)
 
-        self._custom_role_cache[member.id] = role.id
+        await self.set_custom_role(member.id, role.id)
 
         await ctx.reply(
             f"Set role {role.mention} to user {member.mention}",
@@ -179,9 +279,6 @@ class Role(commands.GroupCog, group_name="customrole"):
             allowed_mentions=discord.AllowedMentions.none(),
         )
 
-        if self.refresh_cache.is_running():
-            self.refresh_cache.restart()
-
     @commands.hybrid_command(name="name")
     async def set_role_name(self, ctx: commands.Context, *, name: str):
         if ctx.guild is None:
@@ -191,9 +288,8 @@ class Role(commands.GroupCog, group_name="customrole"):
         role_id = await self.retrieve_custom_role_id(ctx.author.id)
         if role_id is None:
             return await ctx.reply("You do not have a custom role", ephemeral=True)
-        role = ctx.guild.get_role(role_id) or await ctx.guild.fetch_role(role_id)
-        await role.edit(name=name)
-        await ctx.reply(f"Set role name to {role.name}", mention_author=False)
+        await self.bot.action_queue.edit_role(ctx.guild.id, role_id, {"name": name})
+        await ctx.reply(f"Set role name to {name}", mention_author=False)
 
     @commands.hybrid_command(name="color", aliases=["colour"])
     async def set_role_colour(self, ctx: commands.Context, colour: discord.Colour, secondary_colour: Optional[str] = None):
@@ -216,14 +312,13 @@ class Role(commands.GroupCog, group_name="customrole"):
         if role_id is None:
             return await ctx.reply("You do not have a custom role", ephemeral=True)
         if secondary_colour is None:
-            role = ctx.guild.get_role(role_id) or await ctx.guild.fetch_role(role_id)
-            await role.edit(colour=colour)
-            await ctx.reply(f"Set role colour to {role.colour}", mention_author=False)
+            await self.bot.action_queue.edit_role(ctx.guild.id, role_id, {"color": colour.value})
+            await ctx.reply(f"Set role colour to {colour}", mention_author=False)
         else:
             second_colour: discord.Colour = discord.Colour.from_str(secondary_colour)
             # TODO: Clean up after doc update: https://github.com/discord/discord-api-docs/pull/7549
-            url = f"/guilds/{ctx.guild.id}/roles/{role_id}"
-            await self.bot.http.request(discord.http.Route("PATCH", url), json={"colors": {"primary_color": colour.value, "secondary_color": second_colour.value}})
+            payload = {"colors": {"primary_color": colour.value, "secondary_color": second_colour.value}}
+            await self.bot.action_queue.edit_role(ctx.guild.id, role_id, payload)
             await ctx.reply(f"Set role colour to {colour} - {second_colour}", mention_author=False)
 
     @set_role_colour.error
@@ -249,43 +344,55 @@ class Role(commands.GroupCog, group_name="customrole"):
         role_id = await self.retrieve_custom_role_id(ctx.author.id)
         if role_id is None:
             return await ctx.reply("You do not have a custom role", ephemeral=True)
+        action_queue = self.bot.action_queue
         try:
-            role = ctx.guild.get_role(role_id) or await ctx.guild.fetch_role(role_id)
-
             if attachment is not None:
-                if attachment.content_type not in {"image/png", "image/jpg", "image/jpeg"}:
+                # Size and type are known before downloading anything
+                if attachment.size > utils.MAX_ICON_BYTES:
+                    raise utils.IconTooLarge(utils.MAX_ICON_BYTES)
+                if attachment.content_type not in ATTACHMENT_ICON_TYPES:
                     return await ctx.reply("Only PNG and JPEG images are supported", ephemeral=True)
-                with BytesIO() as fp:
-                    await attachment.save(fp)
-                    await role.edit(display_icon=fp.getvalue())
+                icon = await self.download_icon(attachment.url, allowed=ATTACHMENT_ICON_TYPES)
+                if icon is None:
+                    return await ctx.reply("Couldn't download attachment", ephemeral=True)
+                await action_queue.edit_role(ctx.guild.id, role_id, action_queue.icon_payload(icon))
             elif emoji_or_unicode_or_reset is not None:
                 # Typing discord.Emoji is not supported. See: https://github.com/discord/discord-api-docs/discussions/3330
                 # Using partial emoji require you to fetch full emoji before saving. See: https://github.com/Rapptz/discord.py/issues/8148
                 partial_emoji = discord.PartialEmoji.from_str(emoji_or_unicode_or_reset)
                 if partial_emoji.is_custom_emoji() and partial_emoji.id is not None:
-                    async with self.bot.session.get(partial_emoji.url) as resp:
-                        if resp.status != 200:
+                    icon = await self.bot.icon_cache.get_emoji(partial_emoji.id)
+                    if icon is None:
+                        icon = await self.download_icon(partial_emoji.url)
+                        if icon is None:
                             return await ctx.reply("Invalid emoji", ephemeral=True)
-                        with BytesIO() as fp:
-                            # Start stream in chunk
-                            async for chunk in resp.content.iter_chunked(1024 * 1024):
-                                fp.write(chunk)
-                            fp.seek(0)
-                            await role.edit(display_icon=fp.getvalue())
+                        await self.bot.icon_cache.put(icon, emoji_id=partial_emoji.id)
+                    await action_queue.edit_role(ctx.guild.id, role_id, action_queue.icon_payload(icon))
                 elif emoji_or_unicode_or_reset.lower() == "reset":
-                    await role.edit(display_icon=None)
+                    await action_queue.edit_role(ctx.guild.id, role_id, action_queue.icon_payload(None))
                     await ctx.reply("Successfully reset role icon", mention_author=False)
                     return
                 else:
-                    await role.edit(display_icon=emoji_or_unicode_or_reset)
+                    await action_queue.edit_role(ctx.guild.id, role_id, action_queue.icon_payload(emoji_or_unicode_or_reset))
             else:
                 # Invoke help command
                 await ctx.send_help(ctx.command)
                 return
+        except utils.IconError as e:
+            return await ctx.reply(str(e), ephemeral=True)
         except (discord.errors.NotFound, discord.errors.HTTPException) as e:
             return await ctx.reply(f"Failed to set role icon: `{e}`", ephemeral=True)
         await ctx.reply("Successfully set role icon", mention_author=False)
 
+    async def download_icon(self, url: str, *, allowed: AbstractSet[str] = utils.IMAGE_TYPES) -> Optional[bytes]:
+        """Stream an icon from ``url``, None if the CDN doesn't have it"""
+        async with self.bot.session.get(url) as resp:
+            if resp.status != 200:
+                return None
+            if resp.content_length is not None and resp.content_length > utils.MAX_ICON_BYTES:
+                raise utils.IconTooLarge(utils.MAX_ICON_BYTES)
+            return await utils.read_icon(resp.content.iter_chunked(64 * 1024), allowed=allowed)
+
 
 async def setup(bot: LXVBot):
     await bot.add_cog(Role(bot))
@@ -15,6 +15,58 @@ class Cooldown:
     pray_curse: float
 
 
+@dataclass
+class StatBuffer:
+    flush_interval: float
+    max_pending: int
+
+
+@dataclass
+class DatabasePool:
+    pool_size: int
+    max_overflow: int
+    # Seconds to wait for a connection before giving up
+    pool_timeout: float
+    # Seconds before a connection is replaced, -1 keeps them forever
+    pool_recycle: int
+    pool_pre_ping: bool
+    # asyncpg prepared statements kept per connection
+    prepared_statement_cache_size: int
+
+
+@dataclass
+class Database:
+    online: DatabasePool
+    local: DatabasePool
+
+
+@dataclass
+class Metrics:
+    enabled: bool
+    # Port of the local Prometheus endpoint, 0 disables it
+    port: int
+    host: str = "127.0.0.1"
+
+
+@dataclass
+class Health:
+    # Seconds between samples
+    sample_interval: float
+    # Seconds between batch inserts of the buffered samples
+    flush_interval: float
+    # Samples kept in memory while the database is unreachable
+    max_samples: int
+    retention_days: int
+
+
+@dataclass
+class IconCache:
+    directory: str
+    memory_bytes: int
+    # 0 keeps icons in memory only
+    disk_bytes: int
+
+
 @dataclass
 class Config(JSONPyWizard):
     class _(JSONPyWizard.Meta):
@@ -24,3 +76,8 @@ class Config(JSONPyWizard):
     owo_id: int
     guild_id: int
     cooldown: Cooldown
+    stat_buffer: StatBuffer
+    database: Database
+    metrics: Metrics
+    health: Health
+    icon_cache: IconCache
@@ -1 +1,3 @@
+from .action_priority import ActionPriority
 from .owo_command import OwOCommand
+from .stat_period import StatPeriod
@@ -0,0 +1,7 @@
+from enum import IntEnum
+
+
+class ActionPriority(IntEnum):
+    INTERACTIVE = 0
+    LEVEL_UP = 1
+    BACKGROUND = 2
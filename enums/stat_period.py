@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class StatPeriod(Enum):
+    WEEK = "week"
+    MONTH = "month"
+    YEAR = "year"
+    ALL_TIME = "all_time"
@@ -1,7 +1,9 @@
 import asyncio
+from io import BytesIO
 import logging
 import logging.config
 from os import getenv
+from typing import Optional
 from dotenv import load_dotenv
 
 import discord
@@ -77,6 +79,24 @@ def main():
     async def send_error(ctx, error):
         await ctx.reply(f"Failed to send: `{error}`\n" f"`{type(error)}`")
 
+    @bot.command(hidden=True)
+    @commands.is_owner()
+    async def metrics(ctx: commands.Context, enabled: Optional[bool] = None):
+        """
+        Show recorded metrics, pass on/off to toggle recording
+        """
+        if enabled is not None:
+            bot.metrics.enabled = enabled
+            if not enabled:
+                bot.metrics.reset()
+            return await ctx.send(f"Metrics {'enabled' if enabled else 'disabled'}")
+
+        summary = bot.metrics.summary() or "Nothing recorded"
+        if len(summary) > 1900:
+            buffer = BytesIO(bot.metrics.render().encode("utf-8"))
+            return await ctx.send(file=discord.File(buffer, filename="metrics.txt"))
+        await ctx.send(f"```\n{summary}\n```")
+
     @bot.command(name="setmod", aliases=["sm"])
     @check.is_mod()
     async def set_mod(ctx: commands.Context, role: discord.Role, remove: bool = False):
@@ -87,12 +107,16 @@ def main():
             async with bot.async_session() as session:
                 async with session.begin():
                     await session.execute(delete(models.Mod).where(models.Mod.id == role.id))
+            bot.mod_ids.discard(role.id)
             await ctx.reply(f"Removed role **{role.name}** from mods", mention_author=False)
         else:
             async with bot.async_session() as session:
                 async with session.begin():
                     session.add(models.Mod(id=role.id))
+            bot.mod_ids.add(role.id)
             await ctx.reply(f"Set role **{role.name}** to mod", mention_author=False)
+        bot.invalidate_mod_cache(ctx.guild.id)
+        await bot.settings.set("mod_ids", sorted(bot.mod_ids))
 
     @bot.event
     async def on_member_update(before: discord.Member, after: discord.Member):
@@ -4,3 +4,5 @@ from .role_assign import RoleAssign
 from .health_report import HealthReport
 
 from .owo_stat import OwOStat
+from .owo_stat_rollup import OwOStatRollup
+from .member_level import MemberLevel
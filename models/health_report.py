@@ -10,4 +10,4 @@ class HealthReport(OnlineBase):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     data: Mapped[dict] = mapped_column(JSON, nullable=False)
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
\ No newline at end of file
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,16 @@
+import datetime
+
+from sqlalchemy import BigInteger, DateTime, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import LocalBase
+
+
+class MemberLevel(LocalBase):
+    """Last level announced by the level bot for a user"""
+
+    __tablename__ = "member_levels"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    level: Mapped[int] = mapped_column(Integer, nullable=False)
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,19 @@
+from sqlalchemy import BigInteger, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import LocalBase
+
+
+class OwOStatRollup(LocalBase):
+    """Per user totals of :class:`OwOStat` for a week, month, year or all time (``start_day`` is 0)"""
+
+    __tablename__ = "owo_stat_rollups"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    period: Mapped[str] = mapped_column(String(16), primary_key=True)
+    start_day: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    owo_count: Mapped[int] = mapped_column(Integer, default=0)
+    hunt_count: Mapped[int] = mapped_column(Integer, default=0)
+    battle_count: Mapped[int] = mapped_column(Integer, default=0)
+    pray_count: Mapped[int] = mapped_column(Integer, default=0)
+    curse_count: Mapped[int] = mapped_column(Integer, default=0)
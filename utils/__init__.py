@@ -1,5 +1,13 @@
 from .cache import *
+from .command_classifier import *
 from .paginators import *
 from .structure import *
 from .view_util import *
-from .date import *
\ No newline at end of file
+from .action_queue import *
+from .date import *
+from .icon_cache import *
+from .leaderboard import *
+from .metrics import *
+from .stat_buffer import *
+from .stat_writer import *
+from .two_tier_cache import *
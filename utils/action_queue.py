@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import discord
+from discord.http import HTTPClient, Route
+
+from enums.action_priority import ActionPriority
+
+# Setting one of these fields replaces a pending value of the other
+ROLE_FIELD_CONFLICTS = {"color": "colors", "colors": "color"}
+
+
+class _Action:
+    __slots__ = ("key", "run", "payload", "priority", "futures")
+
+    def __init__(
+        self,
+        key: Optional[Hashable],
+        run: Callable[[Dict[Any, Any]], Awaitable[Any]],
+        payload: Dict[Any, Any],
+        priority: ActionPriority,
+    ) -> None:
+        self.key = key
+        self.run = run
+        self.payload = payload
+        self.priority = priority
+        self.futures: List[asyncio.Future] = []
+
+
+class ActionQueue:
+    """
+    Prioritized queue for Discord guild role operations.
+
+    Actions sharing a key are coalesced while they wait: payloads are merged with the latest
+    value winning, the latest callable is run and every caller gets its result. Actions with
+    the same key never run concurrently, so the last submitted write is also the last applied.
+    Rate limits are left to the HTTP client, workers just wait on their route bucket.
+    """
+
+    def __init__(self, http: HTTPClient, *, workers: int = 3) -> None:
+        if workers < 1:
+            raise ValueError("Workers must be 1 or greater")
+        self.http = http
+        self._workers_count = workers
+        self._heap: List[Tuple[int, int, _Action]] = []
+        self._pending: Dict[Hashable, _Action] = {}
+        self._running: set[Hashable] = set()
+        # Waiting for an action with the same key to finish
+        self._deferred: Dict[Hashable, _Action] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        # Heap may hold stale entries of keyed actions, those are counted through the dicts
+        unkeyed = sum(1 for _, _, action in self._heap if action.key is None)
+        return len(self._pending) + len(self._deferred) + unkeyed
+
+    def submit(
+        self,
+        run: Callable[[Dict[Any, Any]], Awaitable[Any]],
+        *,
+        key: Optional[Hashable] = None,
+        payload: Optional[Dict[Any, Any]] = None,
+        priority: ActionPriority = ActionPriority.BACKGROUND,
+        conflicts: Optional[Dict[str, str]] = None,
+    ) -> asyncio.Future:
+        """Queue ``run(payload)``, actions with the same ``key`` are merged until one starts"""
+        future = asyncio.get_running_loop().create_future()
+        action = None
+        if key is not None:
+            action = self._pending.get(key) or self._deferred.get(key)
+        if action is None:
+            action = _Action(key, run, dict(payload or {}), priority)
+            if key is not None:
+                self._pending[key] = action
+            self._push(action)
+        else:
+            for field in payload or {}:
+                if conflicts and field in conflicts:
+                    action.payload.pop(conflicts[field], None)
+            action.payload.update(payload or {})
+            action.run = run
+            if priority < action.priority:
+                action.priority = priority
+                if key not in self._deferred:
+                    # Older heap entry is skipped once this one is taken
+                    self._push(action)
+        action.futures.append(future)
+        return future
+
+    def _push(self, action: _Action):
+        heapq.heappush(self._heap, (action.priority, next(self._counter), action))
+        self._wakeup.set()
+
+    def _pop(self) -> Optional[_Action]:
+        while self._heap:
+            priority, _, action = heapq.heappop(self._heap)
+            if action.key is None:
+                return action
+            if self._pending.get(action.key) is not action or priority != action.priority:
+                # Stale entry left behind by a priority bump or an action already taken
+                continue
+            del self._pending[action.key]
+            if action.key in self._running:
+                self._deferred[action.key] = action
+                continue
+            return action
+        return None
+
+    async def _worker(self):
+        while True:
+            action = self._pop()
+            if action is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if action.key is not None:
+                self._running.add(action.key)
+            try:
+                result = await action.run(action.payload)
+            except Exception as e:
+                for future in action.futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in action.futures:
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                if action.key is not None:
+                    self._running.discard(action.key)
+                    deferred = self._deferred.pop(action.key, None)
+                    if deferred is not None:
+                        self._pending[action.key] = deferred
+                        self._push(deferred)
+
+    def start(self):
+        while len(self._workers) < self._workers_count:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        for _, _, action in self._heap:
+            for future in action.futures:
+                future.cancel()
+        for action in self._deferred.values():
+            for future in action.futures:
+                future.cancel()
+        self._heap.clear()
+        self._pending.clear()
+        self._deferred.clear()
+
+    def edit_role(
+        self,
+        guild_id: int,
+        role_id: int,
+        payload: Dict[str, Any],
+        *,
+        priority: ActionPriority = ActionPriority.INTERACTIVE,
+        reason: Optional[str] = None,
+    ) -> asyncio.Future:
+        """PATCH a role with a raw payload, edits to the same role are merged field by field"""
+
+        async def run(merged: Dict[str, Any]):
+            route = Route("PATCH", "/guilds/{guild_id}/roles/{role_id}", guild_id=guild_id, role_id=role_id)
+            return await self.http.request(route, json=merged, reason=reason)
+
+        return self.submit(run, key=("role", role_id), payload=payload, priority=priority, conflicts=ROLE_FIELD_CONFLICTS)
+
+    def edit_member_roles(
+        self,
+        member: discord.Member,
+        changes: Dict[int, bool],
+        *,
+        priority: ActionPriority = ActionPriority.BACKGROUND,
+        reason: Optional[str] = None,
+    ) -> asyncio.Future:
+        """
+        Add (True) or remove (False) roles of a member.
+
+        Pending changes are merged per role and applied on top of the roles the member has
+        when the edit runs, so queued edits from different sources don't undo each other.
+        Resolves to False when the member already had the requested roles.
+        """
+
+        async def run(merged: Dict[int, bool]) -> bool:
+            current = set(member._roles)
+            desired = {role_id for role_id in current if merged.get(role_id, True)}
+            desired.update(role_id for role_id, keep in merged.items() if keep)
+            if desired == current:
+                return False
+            await member.edit(roles=[discord.Object(role_id) for role_id in desired], reason=reason)
+            return True
+
+        return self.submit(run, key=("member", member.guild.id, member.id), payload=changes, priority=priority)
+
+    @staticmethod
+    def icon_payload(icon: Optional[bytes | str]) -> Dict[str, Any]:
+        """Role payload for an image, a unicode emoji or None to reset"""
+        if icon is None:
+            return {"icon": None, "unicode_emoji": None}
+        if isinstance(icon, bytes):
+            return {"icon": discord.utils._bytes_to_base64_data(icon), "unicode_emoji": None}
+        return {"icon": None, "unicode_emoji": icon}
@@ -1,14 +1,16 @@
+import asyncio
 from collections import OrderedDict
 import logging
+import time
 import discord
-from dataclasses import dataclass
 
-from typing import Any, Optional, Union
-
-from .structure import Node
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar, Union
 
 logger = logging.getLogger(__name__)
 
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
 # Uncomment below for debug purpose
 formatter = logging.Formatter("[{asctime}] [{levelname:^7}] {name}: {message}", style='{')
 logger.setLevel(logging.INFO)
@@ -18,78 +20,90 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
-@dataclass
-class CacheData(Node):
-    def __init__(
-        self, data: discord.Message, keyid: str, *, next_: Optional[Node] = None, prev: Optional[Node] = None
-    ) -> None:
-        super().__init__(data, next_=next_, prev=prev)
-        self.keyid = keyid
-
-
 class MessageCache:
     """
     Represent Cache of :class:`discord.Message` using LRU strategy
+
+    Entries are stored by key, with a message id to keys index so lookups by id
+    don't depend on the key a message was added under.
     """
 
     def __init__(self, maxlen=500) -> None:
         if maxlen < 1:
             raise ValueError("Max length must be 1 or greater")
-        self.__cache = OrderedDict()
+        self.__cache: OrderedDict[str, discord.Message] = OrderedDict()
+        # Keys in insertion order, a message may be cached under several keys
+        self.__keys_by_id: Dict[int, Dict[str, None]] = {}
         self._maxlen = maxlen
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
         logger.debug("Created instance of MessageCache")
 
     @property
     def maxlen(self):
         return self._maxlen
 
+    def __len__(self) -> int:
+        return len(self.__cache)
+
+    def _touch(self, key: Optional[str]) -> Optional[discord.Message]:
+        message = self.__cache.get(key) if key is not None else None
+        if message is None:
+            self.misses += 1
+            return None
+        self.__cache.move_to_end(key)  # type: ignore
+        self.hits += 1
+        return message
+
+    def _pop(self, key: str) -> discord.Message:
+        message = self.__cache.pop(key)
+        keys = self.__keys_by_id[message.id]
+        del keys[key]
+        if not keys:
+            del self.__keys_by_id[message.id]
+        return message
+
+    def _key_for_id(self, message_id: int) -> Optional[str]:
+        keys = self.__keys_by_id.get(message_id)
+        if not keys:
+            return None
+        # Default key first, then the latest custom key
+        key = f"message-{message_id}"
+        return key if key in keys else next(reversed(keys))
+
     def get_message(self, key: str) -> Optional[discord.Message]:
-        return self.__cache.get(key)
+        return self._touch(key)
 
     def query_message_id(self, message_id: int) -> Optional[discord.Message]:
-        # First lookup
         logger.debug("Query message: %s", message_id)
-        if f"message-{message_id}" in self.__cache:
-            return self.__cache[f"message-{message_id}"]
-
-        for message in self.__cache.values():
-            if message.id == message_id:
-                return message
-        return None
+        return self._touch(self._key_for_id(message_id))
 
     def add_message(self, message: discord.Message, custom_key: Optional[str] = None) -> None:
         if custom_key is not None and custom_key.startswith("message-"):
             raise KeyError("'message-' prefix is not allowed as custom key")
         logger.debug("Add message key %s", custom_key or message.id)
-        # Add to hashmap
-        self.__cache[custom_key or f"message-{message.id}"] = message
-        self.__cache.move_to_end(custom_key or f"message-{message.id}")
+        key = custom_key or f"message-{message.id}"
+        if key in self.__cache:
+            self._pop(key)
+        self.__cache[key] = message
+        self.__keys_by_id.setdefault(message.id, {})[key] = None
 
         while len(self.__cache) > self._maxlen:
-            self.__cache.popitem(last=False)
+            self._pop(next(iter(self.__cache)))
+            self.evictions += 1
 
     def remove_message(self, key: Union[str, int]) -> Optional[discord.Message]:
         if isinstance(key, int):
-            if f"message-{key}" in self.__cache:
-                logger.debug("Removed message key %s", key)
-                return self.__cache.pop(f"message-{key}")
-
-            key_del = None
-            for name, message in self.__cache.items():
-                if message.id == key:
-                    key_del = name
-                    break
-            if key_del is not None:
-                return self.__cache.pop(key_del)
-        else:
-            if key in self.__cache:
-                logger.debug("Removed message key %s", key)
-                return self.__cache.pop(key)
-
+            key = self._key_for_id(key)
+        if key is not None and key in self.__cache:
+            logger.debug("Removed message key %s", key)
+            return self._pop(key)
         return None
 
     def clear(self) -> None:
         self.__cache.clear()
+        self.__keys_by_id.clear()
         logger.debug("Cleared cache")
 
 
@@ -144,3 +158,133 @@ class LRUCache:
     def __len__(self) -> int:
         """Return the current size of the cache."""
         return len(self.__cache)
+
+
+class TTLCache(Generic[K, V]):
+    """
+    LRU cache with a time to live per entry.
+
+    :meth:`get_or_load` runs one loader per key no matter how many callers miss at once.
+    ``None`` results are cached for ``negative_ttl`` seconds, or not at all when it is 0.
+    A ``ttl`` of None keeps entries until they are evicted or invalidated.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        *,
+        negative_ttl: Optional[float] = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("Max size must be 1 or greater")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        # Values with their expiry, None for never
+        self.__cache: OrderedDict[K, Tuple[Optional[float], V]] = OrderedDict()
+        self.__loading: Dict[K, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.__cache)
+
+    def __contains__(self, key: K) -> bool:
+        return self._lookup(key, count=False)[0]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _lookup(self, key: K, *, count: bool = True) -> Tuple[bool, Optional[V]]:
+        entry = self.__cache.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= self._clock():
+            del self.__cache[key]
+            entry = None
+        if entry is None:
+            if count:
+                self.misses += 1
+            return False, None
+        self.__cache.move_to_end(key)
+        if count:
+            self.hits += 1
+        return True, entry[1]
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        found, value = self._lookup(key)
+        return value if found else default
+
+    def set(self, key: K, value: V, *, ttl: Optional[float] = None):
+        """Store ``value``, ``ttl`` overrides the default time to live"""
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        # Anything loading for this key is older than this value
+        self.__loading.pop(key, None)
+        self.__cache[key] = (self._clock() + ttl if ttl is not None else None, value)
+        self.__cache.move_to_end(key)
+        while len(self.__cache) > self.maxsize:
+            self.__cache.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        found, value = self._lookup(key)
+        if found:
+            return value  # type: ignore
+        task = self.__loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self.__loading[key] = task
+        # A cancelled caller doesn't cancel the load others are waiting on
+        return await asyncio.shield(task)
+
+    async def _load(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        self.loads += 1
+        try:
+            value = await loader()
+        except BaseException:
+            if self.__loading.get(key) is asyncio.current_task():
+                del self.__loading[key]
+            raise
+        # Invalidated while loading, hand the value to the waiters without keeping it
+        if self.__loading.get(key) is asyncio.current_task():
+            del self.__loading[key]
+            if value is not None or self.negative_ttl != 0:
+                self.set(key, value)
+        return value
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        self.__loading.pop(key, None)
+        entry = self.__cache.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def invalidate(self, key: K):
+        self.pop(key)
+
+    def invalidate_where(self, predicate: Callable[[K], bool]) -> int:
+        """Drop every entry (and running load) whose key matches ``predicate``"""
+        for key in [key for key in self.__loading if predicate(key)]:
+            del self.__loading[key]
+        stale = [key for key in self.__cache if predicate(key)]
+        for key in stale:
+            del self.__cache[key]
+        return len(stale)
+
+    def clear(self):
+        self.__cache.clear()
+        self.__loading.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self.__cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
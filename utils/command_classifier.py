@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from typing import Mapping, Optional, Sequence, Tuple
+
+from enums.owo_command import OwOCommand
+
+COMMAND_ALIASES = {
+    "h": OwOCommand.HUNT,
+    "hunt": OwOCommand.HUNT,
+    "catch": OwOCommand.HUNT,
+    "b": OwOCommand.BATTLE,
+    "battle": OwOCommand.BATTLE,
+    "fight": OwOCommand.BATTLE,
+    "pray": OwOCommand.PRAY,
+    "curse": OwOCommand.CURSE,
+    "owo": OwOCommand.POINT,
+}
+
+
+class CommandClassifier:
+    """
+    Classifies messages into :class:`OwOCommand`.
+
+    Only the prefix and the first token after it are inspected, the rest of the message is returned as is.
+    Prefixes are tried in order, a message starting with a prefix is never counted as a point unless
+    it is the bare prefix or an alias of it.
+    """
+
+    def __init__(self, prefixes: Sequence[str], aliases: Mapping[str, OwOCommand] = COMMAND_ALIASES) -> None:
+        self.prefixes = tuple((prefix.lower(), len(prefix)) for prefix in prefixes)
+        self.aliases = dict(aliases)
+
+    def classify_name(self, name: str) -> Optional[OwOCommand]:
+        return self.aliases.get(name)
+
+    def classify(self, content: str) -> Optional[Tuple[OwOCommand, str]]:
+        # One lowercase copy serves every prefix and the point check
+        lowered = content.lower()
+        for prefix, length in self.prefixes:
+            # Head is compared again for characters whose lowercase form has a different length
+            if not lowered.startswith(prefix) or content[:length].lower() != prefix:
+                continue
+
+            parts = content[length:].split(None, 1)
+            if not parts:
+                return OwOCommand.POINT, ""
+            command = self.aliases.get(parts[0].lower())
+            if command is None:
+                return None
+            return command, parts[1] if len(parts) > 1 else ""
+
+        # Not a command, check if there is owo in message
+        if "owo" in lowered or "uwu" in lowered:
+            return OwOCommand.POINT, ""
+        return None
@@ -29,3 +29,28 @@ def start_of_day(date: datetime.datetime) -> datetime.datetime:
 
 def end_of_day(date: datetime.datetime) -> datetime.datetime:
     return date.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+
+# Day ids count Pacific calendar days since this date. See LXVBot.get_day_id
+DAY_ZERO = datetime.date(2020, 1, 1)
+
+
+def day_to_date(day_id: int) -> datetime.date:
+    return DAY_ZERO + datetime.timedelta(days=day_id)
+
+
+def date_to_day(date: datetime.date) -> int:
+    return (date - DAY_ZERO).days
+
+
+def week_start_day(day_id: int) -> int:
+    """Day id of the Sunday starting the week of ``day_id``"""
+    return day_id - (day_to_date(day_id).weekday() + 1) % 7
+
+
+def month_start_day(day_id: int) -> int:
+    return date_to_day(day_to_date(day_id).replace(day=1))
+
+
+def year_start_day(day_id: int) -> int:
+    return date_to_day(day_to_date(day_id).replace(month=1, day=1))
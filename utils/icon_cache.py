@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+from typing import AbstractSet, AsyncIterable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Discord rejects role icons above 256 KiB
+MAX_ICON_BYTES = 256 * 1024
+
+# Emoji id to hash entries kept in memory, the rest is read back from disk
+MAX_EMOJI_ENTRIES = 4096
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+# Bytes needed to tell every signature apart
+SNIFF_BYTES = 8
+IMAGE_TYPES = frozenset(mime for _, mime in IMAGE_SIGNATURES)
+
+
+class IconError(Exception):
+    pass
+
+
+class IconTooLarge(IconError):
+    def __init__(self, limit: int) -> None:
+        super().__init__(f"Icon must be smaller than {limit // 1024} KiB")
+        self.limit = limit
+
+
+class InvalidIcon(IconError):
+    def __init__(self, allowed: AbstractSet[str]) -> None:
+        names = sorted(mime.split("/")[1].upper() for mime in allowed)
+        super().__init__(f"Only {', '.join(names)} images are supported")
+        self.allowed = allowed
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    """Mime type from the magic bytes of ``data``, None if it isn't a supported image"""
+    for signature, mime in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    return None
+
+
+async def read_icon(
+    chunks: AsyncIterable[bytes], *, limit: int = MAX_ICON_BYTES, allowed: AbstractSet[str] = IMAGE_TYPES
+) -> bytes:
+    """
+    Read an image from a stream of chunks.
+
+    Raises :class:`IconTooLarge` as soon as more than ``limit`` bytes arrived and
+    :class:`InvalidIcon` once the first bytes don't match one of the ``allowed`` types.
+    """
+    parts = []
+    size = 0
+    checked = False
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > limit:
+            raise IconTooLarge(limit)
+        parts.append(chunk)
+        if not checked and size >= SNIFF_BYTES:
+            if sniff_image_type(b"".join(parts)[:SNIFF_BYTES]) not in allowed:
+                raise InvalidIcon(allowed)
+            checked = True
+    # Joined once, no intermediate buffer
+    data = b"".join(parts)
+    if not checked and sniff_image_type(data) not in allowed:
+        raise InvalidIcon(allowed)
+    return data
+
+
+class IconCache:
+    """
+    Bounded LRU of role icons in memory and on disk, keyed by content hash.
+
+    Custom emoji ids point at the hash of their image so a repeated emoji skips the download.
+    Files are named after the hash, the disk LRU order is the file modification time.
+    """
+
+    def __init__(self, directory: str, *, memory_bytes: int, disk_bytes: int) -> None:
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._emojis: OrderedDict[int, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    async def get(self, digest: str) -> Optional[bytes]:
+        data = self._memory.get(digest)
+        if data is not None:
+            self._memory.move_to_end(digest)
+            return data
+        if not self.disk_bytes:
+            return None
+        data = await asyncio.to_thread(self._read_file, digest)
+        if data is not None:
+            self._remember(digest, data)
+        return data
+
+    async def get_emoji(self, emoji_id: int) -> Optional[bytes]:
+        digest = self._emojis.get(emoji_id)
+        if digest is None and self.disk_bytes:
+            digest = await asyncio.to_thread(self._read_emoji_index, emoji_id)
+        data = await self.get(digest) if digest is not None else None
+        if data is None:
+            self.misses += 1
+            return None
+        self._emojis[emoji_id] = digest  # type: ignore
+        self._emojis.move_to_end(emoji_id)
+        self.hits += 1
+        return data
+
+    async def put(self, data: bytes, *, emoji_id: Optional[int] = None) -> str:
+        digest = self.digest(data)
+        self._remember(digest, data)
+        if emoji_id is not None:
+            self._emojis[emoji_id] = digest
+            self._emojis.move_to_end(emoji_id)
+            while len(self._emojis) > MAX_EMOJI_ENTRIES:
+                self._emojis.popitem(last=False)
+        if self.disk_bytes:
+            try:
+                await asyncio.to_thread(self._write_files, digest, data, emoji_id)
+            except OSError as e:
+                logger.warning("Failed to write icon %s to disk cache: %s", digest, e)
+        return digest
+
+    def _remember(self, digest: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._memory.pop(digest, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[digest] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    # region Disk, run in a thread
+    def _read_file(self, digest: str) -> Optional[bytes]:
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        # Drop files that were truncated or tampered with
+        if self.digest(data) != digest:
+            self._unlink(path)
+            return None
+        return data
+
+    def _read_emoji_index(self, emoji_id: int) -> Optional[str]:
+        try:
+            with open(self._path(f"emoji-{emoji_id}"), encoding="ascii") as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        # Only a sha256 hex digest may be used as a file name
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            return None
+        return digest
+
+    def _write_files(self, digest: str, data: bytes, emoji_id: Optional[int]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            # Write then rename so readers never see a partial file
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        else:
+            os.utime(path)
+        if emoji_id is not None:
+            with open(self._path(f"emoji-{emoji_id}"), "w", encoding="ascii") as f:
+                f.write(digest)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        indexes = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp") or not entry.is_file():
+                    continue
+                if entry.name.startswith("emoji-"):
+                    indexes.append(entry.path)
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.name))
+                total += stat.st_size
+        if total <= self.disk_bytes:
+            return
+        evicted = set()
+        for _, size, name in sorted(entries):
+            self._unlink(self._path(name))
+            evicted.add(name)
+            total -= size
+            if total <= self.disk_bytes:
+                break
+        # Emoji ids pointing at an evicted icon
+        for path in indexes:
+            try:
+                with open(path, encoding="ascii") as f:
+                    digest = f.read().strip()
+            except OSError:
+                continue
+            if digest in evicted:
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    # endregion
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_icons": len(self._memory),
+            "memory_bytes": self._memory_size,
+        }
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, Mapping, Optional, Tuple
+
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from enums.stat_period import StatPeriod
+import models
+
+from .stat_writer import STAT_COLUMNS, period_start_day
+
+logger = logging.getLogger(__name__)
+
+DAY_BUCKET = "day"
+READY_KEY = "lb:ready"
+
+# Seconds a bucket is kept after its last increment. All time buckets never expire
+BUCKET_TTLS = {
+    DAY_BUCKET: 3 * 86400,
+    StatPeriod.WEEK.value: 15 * 86400,
+    StatPeriod.MONTH.value: 63 * 86400,
+    StatPeriod.YEAR.value: 400 * 86400,
+}
+
+# KEYS alternate between a board and its total, ARGV[1] is the user id.
+# Runs as a single script so increments applied meanwhile are never lost or double counted
+RESET_USER_SCRIPT = """
+for i = 1, #KEYS, 2 do
+    local score = redis.call("ZSCORE", KEYS[i], ARGV[1])
+    if score then
+        redis.call("ZREM", KEYS[i], ARGV[1])
+        redis.call("DECRBY", KEYS[i + 1], tonumber(score))
+    end
+end
+"""
+
+
+def buckets_for_day(day: int) -> list[Tuple[str, int]]:
+    return [(DAY_BUCKET, day)] + [(period.value, period_start_day(period, day)) for period in StatPeriod]
+
+
+class Leaderboard:
+    """
+    Live OwO leaderboards kept in redis sorted sets.
+
+    Every stat column has one sorted set per bucket (day, week, month, year and all time)
+    holding the count of each user, plus a counter with the bucket total.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+        self._reset_user = redis.register_script(RESET_USER_SCRIPT)
+        # Set when an update could not be applied, leaderboards are out of sync until rebuilt
+        self.stale = False
+
+    @staticmethod
+    def board_key(column: str, bucket: str, start: int) -> str:
+        return f"lb:{column}:{bucket}:{start}"
+
+    @staticmethod
+    def total_key(column: str, bucket: str, start: int) -> str:
+        return f"lb_total:{column}:{bucket}:{start}"
+
+    async def is_ready(self) -> bool:
+        if self.stale:
+            return False
+        return bool(await self.redis.exists(READY_KEY))
+
+    async def apply(self, deltas: Mapping[Tuple[int, int], Dict[str, int]]) -> None:
+        """Add per-column deltas keyed by ``(user_id, day)`` to every bucket containing the day"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            touched = set()
+            for (user_id, day), columns in deltas.items():
+                for bucket, start in buckets_for_day(day):
+                    for column, amount in columns.items():
+                        if not amount:
+                            continue
+                        board_key = self.board_key(column, bucket, start)
+                        total_key = self.total_key(column, bucket, start)
+                        pipe.zincrby(board_key, amount, str(user_id))
+                        pipe.incrby(total_key, amount)
+                        touched.add((board_key, total_key, bucket))
+            for board_key, total_key, bucket in touched:
+                ttl = BUCKET_TTLS.get(bucket)
+                if ttl is not None:
+                    pipe.expire(board_key, ttl)
+                    pipe.expire(total_key, ttl)
+            await pipe.execute()
+
+    async def count(self, column: str, bucket: str, start: int) -> int:
+        return await self.redis.zcard(self.board_key(column, bucket, start))
+
+    async def total(self, column: str, bucket: str, start: int) -> int:
+        return int(await self.redis.get(self.total_key(column, bucket, start)) or 0)
+
+    async def page(self, column: str, bucket: str, start: int, offset: int, limit: int) -> list[Tuple[int, int]]:
+        key = self.board_key(column, bucket, start)
+        rows = await self.redis.zrevrange(key, offset, offset + limit - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in rows]
+
+    async def rebuild(self, async_session: async_sessionmaker[AsyncSession], day: int) -> None:
+        """Rebuild the buckets reachable from ``day`` (including yesterday) from the database"""
+        sources: list[Tuple[str, int, Optional[StatPeriod]]] = [(DAY_BUCKET, day, None), (DAY_BUCKET, day - 1, None)]
+        sources += [(period.value, period_start_day(period, day), period) for period in StatPeriod]
+
+        async with async_session() as session:
+            for bucket, start, period in sources:
+                if period is None:
+                    q = select(models.OwOStat).where(models.OwOStat.day == start)
+                else:
+                    q = select(models.OwOStatRollup).where(
+                        models.OwOStatRollup.period == bucket, models.OwOStatRollup.start_day == start
+                    )
+                rows = (await session.execute(q)).scalars().all()
+
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    for column in STAT_COLUMNS:
+                        board_key = self.board_key(column, bucket, start)
+                        total_key = self.total_key(column, bucket, start)
+                        scores = {str(row.user_id): getattr(row, column) for row in rows if getattr(row, column)}
+                        pipe.delete(board_key)
+                        if scores:
+                            pipe.zadd(board_key, scores)
+                        pipe.set(total_key, sum(scores.values()))
+                        ttl = BUCKET_TTLS.get(bucket)
+                        if ttl is not None:
+                            pipe.expire(board_key, ttl)
+                            pipe.expire(total_key, ttl)
+                    await pipe.execute()
+                logger.info("Rebuilt %s leaderboard starting %s with %s user(s)", bucket, start, len(rows))
+
+        await self.redis.set(READY_KEY, 1)
+        self.stale = False
+
+    async def reset_user(self, user_id: int, day: int) -> None:
+        """Remove a user from every bucket reachable from ``day``"""
+        keys = []
+        for bucket, start in buckets_for_day(day) + [(DAY_BUCKET, day - 1)]:
+            for column in STAT_COLUMNS:
+                keys += [self.board_key(column, bucket, start), self.total_key(column, bucket, start)]
+        await self._reset_user(keys=keys, args=[str(user_id)])
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import bisect
+from contextlib import contextmanager
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+from redis.asyncio import Redis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, **extra: str) -> str:
+    items = [*labels, *extra.items()]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.bounds = bounds
+        # Last slot counts values above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    In-process registry of counters, gauges and timing histograms.
+
+    Nothing is recorded while ``enabled`` is false, every hook only pays for that check.
+    Values can be read with :meth:`summary` or rendered in the Prometheus text format.
+    """
+
+    def __init__(self, *, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.gauges: Dict[Tuple[str, Labels], Callable[[], float]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def inc(self, name: str, amount: float = 1, **labels: Any):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels: Any):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_gauge(self, name: str, callback: Callable[[], float], **labels: Any):
+        """Register a value read on demand, gauges are always available"""
+        self.gauges[(name, _labels(labels))] = callback
+
+    def add_cache(self, name: str, cache: Any):
+        """Export size, hit and miss counts and hit rate of a cache with ``stats()``"""
+        for stat in ("size", "hits", "misses", "hit_rate", "evictions"):
+            self.add_gauge(f"cache_{stat}", lambda stat=stat: cache.stats()[stat], cache=name)
+
+    def read_gauges(self) -> Dict[str, float]:
+        values = {}
+        for (name, labels), callback in self.gauges.items():
+            try:
+                values[f"{name}{_format_labels(labels)}"] = callback()
+            except Exception as e:
+                logger.error("Failed to read gauge %s", name, exc_info=e)
+        return values
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def instrument_engine(self, engine: AsyncEngine, name: str):
+        """Count statements and checkouts, time how long connections are held and report pool usage of ``engine``"""
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.inc("db_statements_total", engine=name)
+
+        # Pool events registered on the engine carry over to the pool dispose() creates
+        @event.listens_for(engine.sync_engine, "checkout")
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            if not self.enabled:
+                return
+            self.inc("db_pool_checkouts_total", engine=name)
+            connection_record.info["checked_out_at"] = time.perf_counter()
+
+        @event.listens_for(engine.sync_engine, "checkin")
+        def checkin(dbapi_connection, connection_record):
+            start = connection_record.info.pop("checked_out_at", None)
+            if start is not None:
+                self.observe("db_connection_hold_seconds", time.perf_counter() - start, engine=name)
+
+        # Pool is looked up on read, dispose() replaces it
+        self.add_gauge("db_pool_size", lambda: engine.sync_engine.pool.size(), engine=name)
+        self.add_gauge("db_pool_checked_out", lambda: engine.sync_engine.pool.checkedout(), engine=name)
+        self.add_gauge("db_pool_overflow", lambda: max(engine.sync_engine.pool.overflow(), 0), engine=name)
+
+    def summary(self, limit: int = 15) -> str:
+        lines = []
+        histograms = sorted(self.histograms.items(), key=lambda item: item[1].sum, reverse=True)
+        for (name, labels), histogram in histograms[:limit]:
+            lines.append(
+                f"{name}{_format_labels(labels)} n={histogram.count} avg={histogram.sum / histogram.count * 1000:.2f}ms "
+                f"p50<={histogram.quantile(0.5) * 1000:g}ms p99<={histogram.quantile(0.99) * 1000:g}ms"
+            )
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines)
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f"{name} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, le=f'{bound:g}')} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    async def start_server(self, host: str, port: int):
+        """Serve :meth:`render` on ``/metrics``"""
+
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("Serving metrics on %s:%s", host, port)
+
+    async def stop_server(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class InstrumentedRedis(Redis):
+    """Redis client counting and timing every command sent outside of pipelines"""
+
+    def __init__(self, metrics: Metrics, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics
+
+    async def execute_command(self, *args: Any, **options: Any):
+        if not self.metrics.enabled:
+            return await super().execute_command(*args, **options)
+        command = str(args[0]).lower()
+        self.metrics.inc("redis_commands_total", command=command)
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            self.metrics.observe("redis_command_seconds", time.perf_counter() - start, command=command)
@@ -1,12 +1,21 @@
+import asyncio
+import json
+import logging
+
 import discord
 from discord.ext import menus, commands
-from sqlalchemy import func, Select, select, text
+from sqlalchemy import and_, func, or_, Select, select, text
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
-from typing import Callable, Optional, TypeVar, Any
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple, TypeVar, Any
+
+if TYPE_CHECKING:
+    from .leaderboard import Leaderboard
 
 _T = TypeVar("_T", bound=Any)
 
+logger = logging.getLogger(__name__)
+
 
 class SimplePages(discord.ui.View, menus.MenuPages):
     """Pagination with ui button"""
@@ -43,6 +52,14 @@ class SimplePages(discord.ui.View, menus.MenuPages):
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         return interaction.user == self.ctx.author
 
+    async def on_timeout(self) -> None:
+        self._release_source()
+
+    def _release_source(self):
+        # Drop rows cached for this menu
+        if isinstance(self._source, QueryEmbedSource):
+            self._source.release()
+
     @discord.ui.button(emoji='⏪', style=discord.ButtonStyle.blurple)
     async def skip_to_first(self, interaction, _):
         await self.show_page(0)
@@ -65,6 +82,7 @@ class SimplePages(discord.ui.View, menus.MenuPages):
         else:
             await self.show_current_page()
             await interaction.response.edit_message(view=self)
+        self._release_source()
 
     @discord.ui.button(emoji='▶', style=discord.ButtonStyle.blurple)
     async def next_page(self, interaction, _):
@@ -74,7 +92,11 @@ class SimplePages(discord.ui.View, menus.MenuPages):
 
     @discord.ui.button(emoji='⏩', style=discord.ButtonStyle.blurple)
     async def skip_to_last(self, interaction, _):
-        await self.show_page(self._source.get_max_pages() - 1)  # type: ignore
+        max_pages = self._source.get_max_pages()
+        await self.show_page(max_pages - 1)  # type: ignore
+        if self._source.get_max_pages() != max_pages:
+            # Source found the real end while loading, e.g. from an approximate count
+            await self.show_page(self._source.get_max_pages() - 1)  # type: ignore
         self.button.label = str(self.current_page + 1)
         await interaction.response.edit_message(view=self)
 
@@ -100,7 +122,58 @@ class EmbedSource(menus.ListPageSource):
         return self.embed
 
 
+class QueryPageCache:
+    """
+    Rows loaded by a :class:`QueryEmbedSource`, fetched in chunks of several pages.
+
+    Lives as long as the menu using it, in-flight chunk loads are shared so a page that is
+    being prefetched is never queried twice. Menus showing the same query may share one cache,
+    in which case the count and every chunk are loaded once for all of them.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: Dict[int, list] = {}
+        # Last (score, id) of each chunk in keyset mode
+        self.boundaries: Dict[int, Tuple[Any, Any]] = {}
+        self.materialized: Optional[list] = None
+        # Exact number of rows, once known
+        self.count: Optional[int] = None
+        # Upper bound of the rows, from an empty chunk past the end with unloaded chunks before it
+        self.max_count: Optional[int] = None
+        self.count_task: Optional[asyncio.Task[int]] = None
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    def clear(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+        if self.count_task is not None:
+            self.count_task.cancel()
+            self.count_task = None
+        self.tasks.clear()
+        self.chunks.clear()
+        self.boundaries.clear()
+        self.materialized = None
+        self.count = None
+        self.max_count = None
+
+
 class QueryEmbedSource(EmbedSource):
+    """
+    Pages of a select query.
+
+    Rows are fetched ``chunk_pages`` pages at a time and kept in a :class:`QueryPageCache`.
+    With ``prefetch`` the next chunk is loaded in the background while the current one is read.
+
+    By default chunks are fetched with ``LIMIT``/``OFFSET``. Passing ``keyset`` as the names of a
+    ``(score, id)`` pair of result columns switches to seek pagination instead: rows are ordered by
+    score descending then id ascending, and the last row of every loaded chunk is remembered so
+    the next chunk starts right after it. Jumps to a chunk without a known boundary (e.g. skipping
+    to the last page) materialize the whole ordering once and serve every later page from it.
+
+    ``approximate_count`` uses the planner row estimate instead of counting the full result,
+    the page count is corrected as soon as the real end is seen.
+    """
+
     def __init__(
         self,
         query: Select[_T],
@@ -110,23 +183,150 @@ class QueryEmbedSource(EmbedSource):
         embed: discord.Embed | None = None,
         *,
         per_page=10,
+        keyset: Optional[Tuple[str, str]] = None,
+        approximate_count: bool = False,
+        chunk_pages: int = 5,
+        prefetch: bool = True,
+        cache: Optional[QueryPageCache] = None,
     ):
         super().__init__([], embed, format_caller, per_page=per_page)
-        self.query = query.order_by(order_by)
+        if chunk_pages < 1:
+            raise ValueError("Chunk pages must be 1 or greater")
         self.async_session = async_session
+        self.approximate_count = approximate_count
+        self.chunk_size = per_page * chunk_pages
+        self.prefetch = prefetch
+        self._owns_cache = cache is None
+        self.cache = cache or QueryPageCache()
+        self._count_query = query.with_only_columns(text("1"), maintain_column_froms=True)
+        self._keyset = None
+        if keyset is None:
+            self.query = query.order_by(order_by)
+        else:
+            subquery = query.subquery()
+            self._keyset = (subquery.c[keyset[0]], subquery.c[keyset[1]])
+            self.query = select(subquery).order_by(self._keyset[0].desc(), self._keyset[1])
+
+    def release(self):
+        """Drop cached rows, unless the cache was given by the caller and may be shared"""
+        if self._owns_cache:
+            self.cache.clear()
 
     async def prepare(self):
+        if self.cache.count is not None:
+            counts = self.cache.count
+        else:
+            if self.cache.count_task is None:
+                self.cache.count_task = asyncio.create_task(self._count())
+            task = self.cache.count_task
+            try:
+                counts = await asyncio.shield(task)
+            except Exception:
+                if self.cache.count_task is task:
+                    self.cache.count_task = None
+                raise
+        self._set_count(counts)
+
+    async def _count(self) -> int:
         async with self.async_session() as session:
-            cursor = await session.execute(
-                select(func.count()).select_from(self.query.with_only_columns(text("1")).subquery())
-            )
-            counts = cursor.scalar_one()
-            self._max_pages = counts // self.per_page + (counts % self.per_page != 0)
+            if self.approximate_count:
+                return await self._estimate_count(session)
+            cursor = await session.execute(select(func.count()).select_from(self._count_query.subquery()))
+            return cursor.scalar_one()
+
+    def _set_count(self, counts: int):
+        self._max_pages = counts // self.per_page + (counts % self.per_page != 0)
+
+    async def _estimate_count(self, session: AsyncSession) -> int:
+        compiled = self._count_query.compile(session.bind, compile_kwargs={"literal_binds": True})
+        cursor = await session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+        plan = cursor.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
 
     async def get_page(self, page_number):
+        chunk_index, page_index = divmod(page_number, self.chunk_size // self.per_page)
+        rows = await self._load_chunk(chunk_index)
+
+        if self.cache.count is not None:
+            self._set_count(self.cache.count)
+        elif (
+            self.approximate_count
+            and len(rows) == self.chunk_size
+            and (chunk_index + 1) * self.chunk_size >= self._max_pages * self.per_page
+        ):
+            # Full chunk reaching past the estimate, allow moving on until the real end is seen
+            self._max_pages = (chunk_index + 1) * (self.chunk_size // self.per_page) + 1
+        if self.cache.count is None and self.cache.max_count is not None:
+            # Estimate was too high
+            self._max_pages = min(self._max_pages, -(-self.cache.max_count // self.per_page))
+
+        if self.prefetch and len(rows) == self.chunk_size:
+            self._schedule_chunk(chunk_index + 1)
+
+        return rows[page_index * self.per_page : (page_index + 1) * self.per_page]
+
+    def _schedule_chunk(self, chunk_index: int) -> Optional[asyncio.Task]:
+        if chunk_index in self.cache.chunks or self.cache.materialized is not None:
+            return None
+        task = self.cache.tasks.get(chunk_index)
+        if task is None:
+            task = self.cache.tasks[chunk_index] = asyncio.create_task(self._fetch_chunk(chunk_index))
+            task.add_done_callback(lambda t: self._chunk_done(chunk_index, t))
+        return task
+
+    def _chunk_done(self, chunk_index: int, task: asyncio.Task):
+        if self.cache.tasks.get(chunk_index) is task:
+            del self.cache.tasks[chunk_index]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Failed to load chunk %s", chunk_index, exc_info=task.exception())
+
+    async def _load_chunk(self, chunk_index: int) -> list:
+        task = self._schedule_chunk(chunk_index)
+        if task is not None:
+            # Shielded since other menus or a prefetch may be waiting on the same load
+            await asyncio.shield(task)
+        if self.cache.materialized is not None:
+            return self.cache.materialized[chunk_index * self.chunk_size : (chunk_index + 1) * self.chunk_size]
+        return self.cache.chunks[chunk_index]
+
+    async def _fetch_chunk(self, chunk_index: int):
+        if self._keyset is None:
+            q = self.query.limit(self.chunk_size).offset(chunk_index * self.chunk_size)
+        elif chunk_index == 0 or chunk_index - 1 in self.cache.boundaries:
+            q = self.query.limit(self.chunk_size)
+            if chunk_index > 0:
+                score, ident = self.cache.boundaries[chunk_index - 1]
+                q = q.where(or_(self._keyset[0] < score, and_(self._keyset[0] == score, self._keyset[1] > ident)))
+        else:
+            async with self.async_session() as session:
+                cursor = await session.execute(self.query)
+                self.cache.materialized = cursor.all()
+            self.cache.count = len(self.cache.materialized)
+            return
+
         async with self.async_session() as session:
-            cursor = await session.execute(self.query.limit(self.per_page).offset(page_number * self.per_page))
-            return cursor.all()
+            cursor = await session.execute(q)
+            rows = cursor.all()
+
+        self.cache.chunks[chunk_index] = rows
+        if self._keyset is not None and rows:
+            last = rows[-1]._mapping
+            self.cache.boundaries[chunk_index] = (last[self._keyset[0]], last[self._keyset[1]])
+        if len(rows) < self.chunk_size and (rows or chunk_index == 0):
+            self.cache.count = chunk_index * self.chunk_size + len(rows)
+        elif not rows:
+            # Past the end, only reachable through an approximate count that was too high
+            loaded = [index for index, chunk in self.cache.chunks.items() if chunk and index < chunk_index]
+            last = max(loaded, default=-1)
+            if last == chunk_index - 1:
+                # Chunk before is full (a partial one sets the count), so the end is right there
+                self.cache.count = chunk_index * self.chunk_size
+            else:
+                # Rows may remain in the chunks that weren't loaded in between
+                bound = chunk_index * self.chunk_size
+                self.cache.max_count = bound if self.cache.max_count is None else min(self.cache.max_count, bound)
 
     async def format_page(self, menu: menus.MenuPages, page):
         if self.format_caller is None:
@@ -135,3 +335,31 @@ class QueryEmbedSource(EmbedSource):
             self.embed.description = self.format_caller(self, menu, page)
         self.embed.set_footer(text=f"Page {menu.current_page+1}/{self.get_max_pages()}")
         return self.embed
+
+
+class LeaderboardSource(EmbedSource):
+    """Pages of a redis backed :class:`Leaderboard` bucket, rows are ``(user_id, count)``"""
+
+    def __init__(
+        self,
+        leaderboard: "Leaderboard",
+        column: str,
+        bucket: str,
+        start: int,
+        format_caller: Callable,
+        embed: discord.Embed | None = None,
+        *,
+        per_page=10,
+    ):
+        super().__init__([], embed, format_caller, per_page=per_page)
+        self.leaderboard = leaderboard
+        self.column = column
+        self.bucket = bucket
+        self.start = start
+
+    async def prepare(self):
+        counts = await self.leaderboard.count(self.column, self.bucket, self.start)
+        self._max_pages = counts // self.per_page + (counts % self.per_page != 0)
+
+    async def get_page(self, page_number):
+        return await self.leaderboard.page(self.column, self.bucket, self.start, page_number * self.per_page, self.per_page)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, Tuple
+
+from discord.ext import tasks
+
+from .stat_writer import STAT_COLUMNS, StatWriter
+
+logger = logging.getLogger(__name__)
+
+
+class StatBuffer:
+    """
+    Write-behind accumulator for :class:`models.OwOStat` increments.
+
+    Increments are kept in memory keyed by ``(user_id, day)`` and written as a single
+    multi-row upsert either every ``flush_interval`` milliseconds or once ``max_pending``
+    keys are waiting, whichever comes first.
+    """
+
+    def __init__(self, writer: StatWriter, *, flush_interval: float = 5000, max_pending: int = 200) -> None:
+        if flush_interval <= 0:
+            raise ValueError("Flush interval must be greater than 0")
+        if max_pending < 1:
+            raise ValueError("Max pending must be 1 or greater")
+        self.writer = writer
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[int, int], Dict[str, int]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self.flush_loop.change_interval(seconds=flush_interval / 1000)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, user_id: int, day: int, column: str, amount: int = 1) -> None:
+        if column not in STAT_COLUMNS:
+            raise ValueError(f"Unknown stat column {column}")
+
+        deltas = self._pending.get((user_id, day))
+        if deltas is None:
+            deltas = self._pending[(user_id, day)] = dict.fromkeys(STAT_COLUMNS, 0)
+        deltas[column] += amount
+
+        if len(self._pending) >= self.max_pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._try_flush())
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await self.writer.write(pending)
+            except BaseException:
+                # Put deltas back so they are retried on next flush
+                for key, deltas in pending.items():
+                    current = self._pending.setdefault(key, dict.fromkeys(STAT_COLUMNS, 0))
+                    for column, amount in deltas.items():
+                        current[column] += amount
+                raise
+
+    async def _try_flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Failed to flush stat buffer", exc_info=e)
+
+    @tasks.loop(seconds=5)
+    async def flush_loop(self):
+        await self._try_flush()
+
+    def start(self) -> None:
+        if not self.flush_loop.is_running():
+            self.flush_loop.start()
+
+    async def close(self) -> None:
+        self.flush_loop.stop()
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.wait([self._flush_task])
+        await self.flush()
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from enums.stat_period import StatPeriod
+import models
+
+from .date import month_start_day, week_start_day, year_start_day
+
+if TYPE_CHECKING:
+    from .leaderboard import Leaderboard
+
+logger = logging.getLogger(__name__)
+
+STAT_COLUMNS = ("owo_count", "hunt_count", "battle_count", "pray_count", "curse_count")
+
+# asyncpg only allows 32767 bind parameters per statement
+MAX_ROWS_PER_STATEMENT = 1000
+
+
+def period_start_day(period: StatPeriod, day: int) -> int:
+    match period:
+        case StatPeriod.WEEK:
+            return week_start_day(day)
+        case StatPeriod.MONTH:
+            return month_start_day(day)
+        case StatPeriod.YEAR:
+            return year_start_day(day)
+        case StatPeriod.ALL_TIME:
+            return 0
+
+
+class WriteGuard:
+    """
+    Reader/writer style guard, any number of shared holders or a single exclusive one.
+
+    Exclusive requests block new shared holders while they wait, so a steady stream of
+    writes can't starve them.
+    """
+
+    def __init__(self) -> None:
+        self._cond = asyncio.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @asynccontextmanager
+    async def shared(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._exclusive)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._exclusive)
+            self._exclusive = True
+            try:
+                await self._cond.wait_for(lambda: self._shared == 0)
+            except BaseException:
+                self._exclusive = False
+                self._cond.notify_all()
+                raise
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class StatWriter:
+    """
+    Upsert based writer for :class:`models.OwOStat`.
+
+    Relies on the ``(day, user_id)`` unique constraint so every write is a single
+    ``INSERT ... ON CONFLICT DO UPDATE`` round trip. Concurrent first writes for the same
+    day are resolved by postgres instead of racing on a select-then-insert.
+
+    The same deltas are added to :class:`models.OwOStatRollup` in the same transaction,
+    keeping weekly, monthly, yearly and all time totals in step with the daily rows.
+    Once committed they are also pushed to the redis ``leaderboard`` when one is given.
+    """
+
+    def __init__(
+        self, async_session: async_sessionmaker[AsyncSession], *, leaderboard: Optional[Leaderboard] = None
+    ) -> None:
+        self.async_session = async_session
+        self.leaderboard = leaderboard
+        # Writes run concurrently, leaderboard rebuilds and resets wait for them and hold them off.
+        # A write holds it from its upsert to its leaderboard update, so a rebuild never reads a
+        # committed row whose delta is then applied on top of it
+        self.guard = WriteGuard()
+        self._listeners: list[Callable[[Mapping[Tuple[int, int], Dict[str, int]]], None]] = []
+
+    def add_listener(self, listener: Callable[[Mapping[Tuple[int, int], Dict[str, int]]], None]) -> None:
+        """Register a callback receiving the deltas of every committed write"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Mapping[Tuple[int, int], Dict[str, int]]], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    @staticmethod
+    def upsert(rows: list[dict]):
+        stmt = insert(models.OwOStat).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[models.OwOStat.day, models.OwOStat.user_id],
+            set_={column: getattr(models.OwOStat, column) + getattr(stmt.excluded, column) for column in STAT_COLUMNS},
+        )
+
+    @staticmethod
+    def upsert_rollups(rows: list[dict]):
+        stmt = insert(models.OwOStatRollup).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[models.OwOStatRollup.user_id, models.OwOStatRollup.period, models.OwOStatRollup.start_day],
+            set_={column: getattr(models.OwOStatRollup, column) + getattr(stmt.excluded, column) for column in STAT_COLUMNS},
+        )
+
+    @staticmethod
+    def rollup_rows(deltas: Mapping[Tuple[int, int], Dict[str, int]]) -> list[dict]:
+        # Days of the same period are merged here, a single upsert can't touch the same row twice
+        rollups: Dict[Tuple[int, str, int], Dict[str, int]] = {}
+        for (user_id, day), columns in deltas.items():
+            for period in StatPeriod:
+                key = (user_id, period.value, period_start_day(period, day))
+                current = rollups.get(key)
+                if current is None:
+                    rollups[key] = dict(columns)
+                else:
+                    for column, amount in columns.items():
+                        current[column] += amount
+        return [
+            {"user_id": user_id, "period": period, "start_day": start_day, **columns}
+            for (user_id, period, start_day), columns in rollups.items()
+        ]
+
+    async def increment(self, user_id: int, day: int, column: str, amount: int = 1) -> None:
+        if column not in STAT_COLUMNS:
+            raise ValueError(f"Unknown stat column {column}")
+        deltas = dict.fromkeys(STAT_COLUMNS, 0)
+        deltas[column] = amount
+        await self.write({(user_id, day): deltas})
+
+    async def write(self, deltas: Mapping[Tuple[int, int], Dict[str, int]]) -> None:
+        """Apply per-column deltas keyed by ``(user_id, day)`` in one transaction"""
+        if not deltas:
+            return
+        rows = [{"user_id": user_id, "day": day, **columns} for (user_id, day), columns in deltas.items()]
+        rollup_rows = self.rollup_rows(deltas)
+        logger.debug("Writing %s stat row(s) and %s rollup row(s)", len(rows), len(rollup_rows))
+        async with self.guard.shared():
+            async with self.async_session() as session:
+                async with session.begin():
+                    for i in range(0, len(rows), MAX_ROWS_PER_STATEMENT):
+                        await session.execute(self.upsert(rows[i : i + MAX_ROWS_PER_STATEMENT]))
+                    for i in range(0, len(rollup_rows), MAX_ROWS_PER_STATEMENT):
+                        await session.execute(self.upsert_rollups(rollup_rows[i : i + MAX_ROWS_PER_STATEMENT]))
+
+            if self.leaderboard is not None:
+                # Database is the source of truth, a failure here must not retry the write
+                try:
+                    await self.leaderboard.apply(deltas)
+                except Exception as e:
+                    logger.error("Failed to update leaderboard, marking it stale", exc_info=e)
+                    self.leaderboard.stale = True
+
+        for listener in self._listeners:
+            try:
+                listener(deltas)
+            except Exception as e:
+                logger.error("Stat write listener %s failed", listener, exc_info=e)
+
+    async def rebuild_leaderboard(self, day: int) -> None:
+        if self.leaderboard is None:
+            raise ValueError("No leaderboard attached")
+        async with self.guard.exclusive():
+            await self.leaderboard.rebuild(self.async_session, day)
+
+    async def reset_user(self, user_id: int, day: int) -> None:
+        """Delete every stat of a user, then remove them from the leaderboard buckets reachable from ``day``"""
+        async with self.guard.exclusive():
+            async with self.async_session() as session:
+                async with session.begin():
+                    await session.execute(delete(models.OwOStat).where(models.OwOStat.user_id == user_id))
+                    await session.execute(delete(models.OwOStatRollup).where(models.OwOStatRollup.user_id == user_id))
+
+            if self.leaderboard is not None:
+                try:
+                    await self.leaderboard.reset_user(user_id, day)
+                except Exception as e:
+                    logger.error("Failed to reset leaderboard, marking it stale", exc_info=e)
+                    self.leaderboard.stale = True
@@ -2,7 +2,12 @@ from __future__ import annotations
 
 
 import asyncio
-from typing import Optional
+import heapq
+import itertools
+from typing import Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
 
 
 class Node:
@@ -54,3 +59,55 @@ class AsyncLinkedList(LinkedList):
     async def add_node(self, node: Node):
         async with self.lock:
             super().add_node(node)
+
+
+class ExpiringDict(Generic[K, V]):
+    """
+    Dictionary whose entries expire at a given timestamp.
+
+    Expired entries are never returned and are dropped lazily on lookup, or in bulk by :meth:`expire`.
+    Expiry times are kept in a heap so a sweep only touches entries that are actually due.
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[K, tuple[float, V]] = {}
+        self._heap: list[tuple[float, int, K]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def set(self, key: K, value: V, expires_at: float):
+        self._data[key] = (expires_at, value)
+        heapq.heappush(self._heap, (expires_at, next(self._counter), key))
+
+    def get(self, key: K, now: float) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def pop(self, key: K) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def expire(self, now: float) -> int:
+        """Drop every entry expired at ``now``, returns the number of entries removed"""
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self._heap)
+            entry = self._data.get(key)
+            # Skip heap items left behind by a key set again or already removed
+            if entry is not None and entry[0] == expires_at:
+                del self._data[key]
+                removed += 1
+        if not self._data:
+            self._heap.clear()
+        return removed
+
+    def clear(self):
+        self._data.clear()
+        self._heap.clear()
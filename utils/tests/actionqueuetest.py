@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from action_queue import ActionQueue  # noqa: E402
+from enums.action_priority import ActionPriority  # noqa: E402
+
+
+def member(roles: list[int]):
+    m = SimpleNamespace(id=1, guild=SimpleNamespace(id=2), _roles=list(roles))
+
+    async def edit(*, roles, reason=None):
+        m._roles = [role.id for role in roles]
+
+    m.edit = AsyncMock(side_effect=edit)
+    return m
+
+
+class Test(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await self.queue.close()
+
+    async def test_coalesce_same_key(self):
+        self.queue = ActionQueue(None, workers=1)  # type: ignore
+        m = member([10, 11])
+        first = self.queue.edit_member_roles(m, {12: True})
+        second = self.queue.edit_member_roles(m, {11: False, 13: True})
+        self.assertEqual(len(self.queue), 1)
+
+        self.queue.start()
+        self.assertEqual(await asyncio.gather(first, second), [True, True])
+        m.edit.assert_awaited_once()
+        self.assertEqual(sorted(m._roles), [10, 12, 13])
+
+    async def test_priority_order(self):
+        self.queue = ActionQueue(None, workers=1)  # type: ignore
+        order = []
+
+        def record(name: str):
+            async def run(payload):
+                order.append(name)
+
+            return run
+
+        futures = [
+            self.queue.submit(record("background"), priority=ActionPriority.BACKGROUND),
+            self.queue.submit(record("level up"), priority=ActionPriority.LEVEL_UP),
+            self.queue.submit(record("interactive"), priority=ActionPriority.INTERACTIVE),
+        ]
+        self.queue.start()
+        await asyncio.gather(*futures)
+        self.assertEqual(order, ["interactive", "level up", "background"])
+
+    async def test_defer_while_running(self):
+        self.queue = ActionQueue(None, workers=2)  # type: ignore
+        release = asyncio.Event()
+        runs = []
+
+        async def run(payload):
+            runs.append(dict(payload))
+            if len(runs) == 1:
+                await release.wait()
+            return len(runs)
+
+        first = self.queue.submit(run, key="role", payload={"name": "a"})
+        self.queue.start()
+        await asyncio.sleep(0)
+        self.assertEqual(runs, [{"name": "a"}])
+
+        # Same key is in flight, both edits wait for it and are merged
+        second = self.queue.submit(run, key="role", payload={"name": "b", "color": 1})
+        third = self.queue.submit(run, key="role", payload={"name": "c"})
+        await asyncio.sleep(0)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(len(self.queue), 1)
+
+        release.set()
+        self.assertEqual(await asyncio.gather(first, second, third), [1, 2, 2])
+        self.assertEqual(runs, [{"name": "a"}, {"name": "c", "color": 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from cache import MessageCache, TTLCache
+
+
+def message(id: int):
+    return SimpleNamespace(id=id)
+
+
+class Test(unittest.TestCase):
+    def test_query_custom_key(self):
+        cache = MessageCache()
+        a = message(1)
+        cache.add_message(a, "custom")
+        self.assertIs(cache.query_message_id(1), a)
+        self.assertIs(cache.get_message("custom"), a)
+        self.assertIsNone(cache.query_message_id(2))
+
+    def test_get_refreshes_recency(self):
+        cache = MessageCache(maxlen=2)
+        a, b, c = message(1), message(2), message(3)
+        cache.add_message(a)
+        cache.add_message(b)
+        cache.get_message("message-1")
+        cache.add_message(c)
+        self.assertIs(cache.query_message_id(1), a)
+        self.assertIsNone(cache.query_message_id(2))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_remove_by_id(self):
+        cache = MessageCache()
+        a = message(1)
+        cache.add_message(a, "custom")
+        self.assertIs(cache.remove_message(1), a)
+        self.assertIsNone(cache.remove_message(1))
+        self.assertIsNone(cache.query_message_id(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_replace_key(self):
+        cache = MessageCache()
+        a, b = message(1), message(2)
+        cache.add_message(a, "custom")
+        cache.add_message(b, "custom")
+        self.assertIsNone(cache.query_message_id(1))
+        self.assertIs(cache.query_message_id(2), b)
+        self.assertEqual(len(cache), 1)
+
+    def test_counters(self):
+        cache = MessageCache()
+        cache.add_message(message(1))
+        cache.get_message("message-1")
+        cache.get_message("missing")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TTLCacheTest(unittest.IsolatedAsyncioTestCase):
+    def test_expiry(self):
+        clock = Clock()
+        cache = TTLCache(ttl=10, clock=clock)
+        cache.set("a", 1)
+        clock.now = 9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 10
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_maxsize(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.evictions, 1)
+
+    async def test_single_flight(self):
+        cache = TTLCache()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            return "value"
+
+        results = await asyncio.gather(*(cache.get_or_load("a", load) for _ in range(5)))
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(calls, 1)
+        self.assertEqual(await cache.get_or_load("a", load), "value")
+        self.assertEqual(calls, 1)
+
+    async def test_negative_caching(self):
+        clock = Clock()
+        cache = TTLCache(ttl=60, negative_ttl=5, clock=clock)
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            return None
+
+        self.assertIsNone(await cache.get_or_load("a", load))
+        self.assertIsNone(await cache.get_or_load("a", load))
+        self.assertEqual(calls, 1)
+        clock.now = 5
+        await cache.get_or_load("a", load)
+        self.assertEqual(calls, 2)
+
+    async def test_invalidate_while_loading(self):
+        cache = TTLCache()
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return "stale"
+
+        task = asyncio.ensure_future(cache.get_or_load("a", load))
+        await asyncio.sleep(0)
+        cache.invalidate("a")
+        release.set()
+        self.assertEqual(await task, "stale")
+        self.assertNotIn("a", cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, ROOT)
+
+from benchmarks.classifier import legacy_get_command  # noqa: E402
+from enums.owo_command import OwOCommand  # noqa: E402
+from utils.command_classifier import CommandClassifier  # noqa: E402
+
+EXTRA_MESSAGES = ["", " ", "H", "HUNT", "hunting", "owo  h  extra", "İowo", "hİ owo", "uWu", "catch", "x owo h"]
+
+
+class Test(unittest.TestCase):
+    def assertParity(self, messages: list[str], prefix: str):
+        classifier = CommandClassifier((prefix, "owo"))
+        for message in messages:
+            with self.subTest(message=message, prefix=prefix):
+                new = classifier.classify(message)
+                if new is not None:
+                    # Legacy lowercased and split the arguments
+                    new = new[0], new[1].lower().split()
+                self.assertEqual(new, legacy_get_command(message, prefix))
+
+    def test_corpus_parity(self):
+        with open(os.path.join(ROOT, "benchmarks", "messages.txt"), encoding="utf-8") as f:
+            messages = [line.rstrip("\n") for line in f if line.strip()]
+        for prefix in ("h", "lxv", "owoh"):
+            self.assertParity(messages + EXTRA_MESSAGES, prefix)
+
+    def test_rest_keeps_case(self):
+        classifier = CommandClassifier(("h", "owo"))
+        self.assertEqual(classifier.classify("OwO Pray @Someone Else"), (OwOCommand.PRAY, "@Someone Else"))
+        self.assertEqual(classifier.classify_name("battle"), OwOCommand.BATTLE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from structure import ExpiringDict
+
+
+class Test(unittest.TestCase):
+    def test_get_before_expiry(self):
+        d = ExpiringDict()
+        d.set("a", 1, 10)
+        self.assertEqual(d.get("a", 5), 1)
+        self.assertEqual(len(d), 1)
+
+    def test_get_after_expiry(self):
+        d = ExpiringDict()
+        d.set("a", 1, 10)
+        self.assertIsNone(d.get("a", 10))
+        self.assertEqual(len(d), 0)
+
+    def test_expire(self):
+        d = ExpiringDict()
+        d.set("a", 1, 10)
+        d.set("b", 2, 20)
+        d.set("c", 3, 30)
+        self.assertEqual(d.expire(20), 2)
+        self.assertEqual(len(d), 1)
+        self.assertEqual(d.get("c", 20), 3)
+
+    def test_expire_after_set_again(self):
+        d = ExpiringDict()
+        d.set("a", 1, 10)
+        d.set("a", 2, 30)
+        self.assertEqual(d.expire(20), 0)
+        self.assertEqual(d.get("a", 20), 2)
+        self.assertEqual(d.expire(30), 1)
+        self.assertEqual(len(d), 0)
+
+    def test_pop(self):
+        d = ExpiringDict()
+        d.set("a", 1, 10)
+        self.assertEqual(d.pop("a"), 1)
+        self.assertIsNone(d.pop("a"))
+        self.assertEqual(d.expire(10), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from sqlalchemy import Column, Integer, MetaData, Table, event, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from paginators import QueryEmbedSource, SimplePages
+
+metadata = MetaData()
+scores = Table("scores", metadata, Column("id", Integer, primary_key=True), Column("score", Integer))
+# Scores tied in groups of 4, chunk boundaries fall inside a group
+ranked = Table("ranked", metadata, Column("user_id", Integer, primary_key=True), Column("score", Integer))
+RANKED_ROWS = 23
+
+
+class OverestimatedSource(QueryEmbedSource):
+    async def _estimate_count(self, session) -> int:
+        return 100
+
+
+class Test(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+            await conn.execute(insert(scores), [{"id": i, "score": i} for i in range(20)])
+            await conn.execute(insert(ranked), [{"user_id": i, "score": i // 4} for i in range(RANKED_ROWS)])
+        self.session = async_sessionmaker(self.engine)
+        self.statements = []
+
+        @event.listens_for(self.engine.sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.statements.append(statement)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    def source(self, **kwargs):
+        query = select(scores.c.id, scores.c.score)
+        return OverestimatedSource(
+            query, scores.c.score.desc(), self.session, None, per_page=5, chunk_pages=2, approximate_count=True, **kwargs
+        )
+
+    def keyset_source(self, **kwargs):
+        query = select(ranked.c.user_id, ranked.c.score)
+        kwargs.setdefault("prefetch", False)
+        return QueryEmbedSource(
+            query, None, self.session, None, per_page=5, chunk_pages=2, keyset=("score", "user_id"), **kwargs
+        )
+
+    def expected_ranking(self) -> list[tuple[int, int]]:
+        return sorted(((i, i // 4) for i in range(RANKED_ROWS)), key=lambda row: (-row[1], row[0]))
+
+    async def test_keyset_ties(self):
+        source = self.keyset_source()
+        await source.prepare()
+        self.assertEqual(source.get_max_pages(), 5)
+        rows = []
+        for page in range(source.get_max_pages()):
+            rows += [tuple(row) for row in await source.get_page(page)]
+        self.assertEqual(rows, self.expected_ranking())
+        # Every chunk seeked from the one before instead of materializing
+        self.assertIsNone(source.cache.materialized)
+        self.assertEqual(sorted(source.cache.boundaries), [0, 1, 2])
+        self.assertEqual(source.cache.count, RANKED_ROWS)
+
+    async def test_prefetch_next_chunk(self):
+        source = self.keyset_source(prefetch=True)
+        await source.prepare()
+        await source.get_page(0)
+        # Chunk 1 is loading in the background, chunk 2 waits until chunk 1 is read
+        self.assertEqual(list(source.cache.tasks), [1])
+        await source.cache.tasks[1]
+        self.assertIn(1, source.cache.chunks)
+        self.assertNotIn(2, source.cache.chunks)
+
+        before = len(self.statements)
+        self.assertEqual([tuple(row) for row in await source.get_page(2)], self.expected_ranking()[10:15])
+        self.assertEqual(len(self.statements), before)
+        await source.cache.tasks[2]
+        # Partial chunk, nothing left to prefetch
+        await source.get_page(4)
+        self.assertEqual(source.cache.tasks, {})
+
+    async def test_skip_to_last_materializes(self):
+        source = self.keyset_source()
+        await source.prepare()
+        menu = SimplePages(source)
+        menu.message = AsyncMock()
+        interaction = SimpleNamespace(response=SimpleNamespace(edit_message=AsyncMock()))
+        rendered = []
+        source.format_caller = lambda source, menu, page: rendered.append([tuple(row) for row in page]) or ""
+
+        await menu.skip_to_last.callback(interaction)
+        self.assertEqual(menu.current_page, 4)
+        self.assertEqual(rendered[-1], self.expected_ranking()[20:])
+        self.assertEqual(len(source.cache.materialized), RANKED_ROWS)
+        self.assertEqual(source.cache.count, RANKED_ROWS)
+
+        # Earlier pages come from the materialized rows
+        before = len(self.statements)
+        self.assertEqual([tuple(row) for row in await source.get_page(1)], self.expected_ranking()[5:10])
+        self.assertEqual(len(self.statements), before)
+
+    async def test_skip_to_last_with_overestimate(self):
+        query = select(ranked.c.user_id, ranked.c.score)
+        source = OverestimatedSource(
+            query, None, self.session, None, per_page=5, chunk_pages=2, keyset=("score", "user_id"), approximate_count=True
+        )
+        await source.prepare()
+        self.assertEqual(source.get_max_pages(), 20)
+        menu = SimplePages(source)
+        menu.message = AsyncMock()
+        source.format_caller = lambda source, menu, page: ""
+
+        await menu.skip_to_last.callback(SimpleNamespace(response=SimpleNamespace(edit_message=AsyncMock())))
+        # Estimated last page is past the end, the menu moves to the real one
+        self.assertEqual(source.get_max_pages(), 5)
+        self.assertEqual(menu.current_page, 4)
+
+    async def test_empty_chunk_after_full_chunk(self):
+        source = self.source(prefetch=False)
+        await source.prepare()
+        self.assertEqual(source.get_max_pages(), 20)
+        self.assertEqual(len(await source.get_page(3)), 5)
+        # Chunk 2 is past the 20 rows, chunk 1 was full
+        self.assertEqual(await source.get_page(4), [])
+        self.assertEqual(source.cache.count, 20)
+        self.assertEqual(source.get_max_pages(), 4)
+
+    async def test_empty_chunk_after_gap(self):
+        source = self.source(prefetch=False)
+        await source.prepare()
+        self.assertEqual(await source.get_page(19), [])
+        self.assertIsNone(source.cache.count)
+        self.assertEqual(source.get_max_pages(), 18)
+        self.assertEqual(await source.get_page(4), [])
+        self.assertEqual(source.get_max_pages(), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import datetime
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from utils.date import date_to_day  # noqa: E402
+from utils.stat_buffer import StatBuffer  # noqa: E402
+from utils.stat_writer import STAT_COLUMNS, StatWriter  # noqa: E402
+
+
+def day(year: int, month: int, day: int) -> int:
+    return date_to_day(datetime.date(year, month, day))
+
+
+def stats(**columns: int) -> dict[str, int]:
+    deltas = dict.fromkeys(STAT_COLUMNS, 0)
+    deltas.update(columns)
+    return deltas
+
+
+class RollupTest(unittest.TestCase):
+    def rollups(self, deltas) -> dict[tuple[int, str, int], dict[str, int]]:
+        rows = StatWriter.rollup_rows(deltas)
+        keys = [(row.pop("user_id"), row.pop("period"), row.pop("start_day")) for row in rows]
+        self.assertEqual(len(keys), len(set(keys)))
+        return dict(zip(keys, rows))
+
+    def test_bucket_keys(self):
+        # Saturday 2024-03-02 belongs to the week starting Sunday 2024-02-25
+        rollups = self.rollups({(1, day(2024, 3, 2)): stats(owo_count=2)})
+        self.assertEqual(
+            sorted(rollups),
+            sorted(
+                [
+                    (1, "week", day(2024, 2, 25)),
+                    (1, "month", day(2024, 3, 1)),
+                    (1, "year", day(2024, 1, 1)),
+                    (1, "all_time", 0),
+                ]
+            ),
+        )
+
+    def test_sunday_starts_week(self):
+        rollups = self.rollups({(1, day(2024, 3, 3)): stats(owo_count=1)})
+        self.assertIn((1, "week", day(2024, 3, 3)), rollups)
+
+    def test_merge_days_of_same_period(self):
+        # Thursday and Saturday of one week, the Saturday is also in another month
+        rollups = self.rollups(
+            {
+                (1, day(2024, 2, 29)): stats(owo_count=1, hunt_count=2),
+                (1, day(2024, 3, 2)): stats(owo_count=3),
+                (2, day(2024, 3, 2)): stats(pray_count=1),
+            }
+        )
+        self.assertEqual(rollups[(1, "week", day(2024, 2, 25))], stats(owo_count=4, hunt_count=2))
+        self.assertEqual(rollups[(1, "month", day(2024, 2, 1))], stats(owo_count=1, hunt_count=2))
+        self.assertEqual(rollups[(1, "month", day(2024, 3, 1))], stats(owo_count=3))
+        self.assertEqual(rollups[(1, "all_time", 0)], stats(owo_count=4, hunt_count=2))
+        self.assertEqual(rollups[(2, "year", day(2024, 1, 1))], stats(pray_count=1))
+
+
+class BufferTest(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_flush_keeps_deltas(self):
+        writer = AsyncMock()
+        buffer = StatBuffer(writer, flush_interval=1000, max_pending=100)
+
+        async def failing_write(pending):
+            # Increments arriving while the write is in flight
+            buffer.add(1, 10, "owo_count")
+            buffer.add(2, 10, "hunt_count")
+            raise RuntimeError("Database unavailable")
+
+        buffer.add(1, 10, "owo_count", 2)
+        buffer.add(1, 11, "battle_count")
+        writer.write.side_effect = failing_write
+        with self.assertRaises(RuntimeError):
+            await buffer.flush()
+        self.assertEqual(len(buffer), 3)
+
+        writer.write.side_effect = None
+        await buffer.flush()
+        writer.write.assert_awaited_with(
+            {
+                (1, 10): stats(owo_count=3),
+                (1, 11): stats(battle_count=1),
+                (2, 10): stats(hunt_count=1),
+            }
+        )
+        self.assertEqual(len(buffer), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
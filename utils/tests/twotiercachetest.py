@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+import unittest
+
+import fakeredis
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from utils.two_tier_cache import INVALIDATION_CHANNEL, CacheBus, TwoTierCache  # noqa: E402
+
+
+async def eventually(predicate, timeout: float = 2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("Condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+def loader(value):
+    async def load():
+        return value
+
+    return load
+
+
+class Test(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Two processes sharing one redis
+        server = fakeredis.FakeServer()
+        self.redis = [fakeredis.FakeAsyncRedis(server=server, decode_responses=True) for _ in range(2)]
+        self.buses = [CacheBus(redis) for redis in self.redis]
+        self.caches = [TwoTierCache(redis, bus, "settings") for redis, bus in zip(self.redis, self.buses)]
+        self.invalidated = []
+        self.caches[1].add_listener(self.on_invalidate)
+        for bus in self.buses:
+            bus.start()
+        while (await self.redis[0].pubsub_numsub(INVALIDATION_CHANNEL))[0][1] < 2:
+            await asyncio.sleep(0.01)
+
+    async def asyncTearDown(self):
+        for bus in self.buses:
+            await bus.close()
+        for redis in self.redis:
+            await redis.aclose()
+
+    async def on_invalidate(self, key):
+        self.invalidated.append(key)
+
+    async def test_set_evicts_other_process(self):
+        writer, reader = self.caches
+        self.assertEqual(await reader.get_or_load("prefix", loader("lxv")), "lxv")
+        self.assertIn("prefix", reader.local)
+
+        await writer.set("prefix", "owo")
+        await eventually(lambda: "prefix" not in reader.local)
+        await eventually(lambda: self.invalidated == ["prefix"])
+        # Next read comes from redis, not the loader
+        self.assertEqual(await reader.get_or_load("prefix", loader("stale")), "owo")
+        # Writer keeps its own copy
+        self.assertEqual(writer.local.get("prefix"), "owo")
+
+    async def test_invalidate_evicts_other_process(self):
+        writer, reader = self.caches
+        await reader.get_or_load("prefix", loader("lxv"))
+        await writer.invalidate("prefix")
+        await eventually(lambda: "prefix" not in reader.local)
+        self.assertEqual(await reader.get_or_load("prefix", loader("fresh")), "fresh")
+
+
+if __name__ == "__main__":
+    unittest.main()
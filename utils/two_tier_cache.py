@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import uuid
+
+from redis.asyncio import Redis
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Called with the invalidated key, None when every key may be stale
+InvalidationListener = Callable[[Optional[str]], Awaitable[Any]]
+
+
+class CacheBus:
+    """
+    Broadcasts cache invalidations between processes over redis pub/sub.
+
+    Messages sent by this process are ignored on receipt, the writer already has the new value.
+    """
+
+    def __init__(self, redis: Redis, channel: str = INVALIDATION_CHANNEL) -> None:
+        self.redis = redis
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self.caches: Dict[str, TwoTierCache] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, cache: TwoTierCache):
+        self.caches[cache.namespace] = cache
+
+    async def publish(self, namespace: str, key: Optional[str]):
+        message = json.dumps({"origin": self.origin, "namespace": namespace, "key": key})
+        await self.redis.publish(self.channel, message)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    if connected_before:
+                        # Invalidations may have been missed while disconnected
+                        for cache in self.caches.values():
+                            cache.drop_local(None)
+                    connected_before = True
+                    async for message in pubsub.listen():
+                        self._handle(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Cache invalidation subscription failed, retrying: %s", e)
+                await asyncio.sleep(5)
+
+    def _handle(self, data: str):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logger.warning("Malformed cache invalidation: %r", data)
+            return
+        if message.get("origin") == self.origin:
+            return
+        cache = self.caches.get(message.get("namespace"))
+        if cache is not None:
+            cache.drop_local(message.get("key"))
+
+
+class TwoTierCache:
+    """
+    In-process cache (L1) in front of redis (L2) for values that are expensive to load.
+
+    Misses go to redis first and only then to ``loader``, so a restarted process warms up
+    from redis instead of the database. Writers update both tiers and notify other processes
+    through the :class:`CacheBus`, which drop their L1 copy and call their listeners.
+    Values are stored as JSON.
+    """
+
+    def __init__(
+        self, redis: Redis, bus: CacheBus, namespace: str, *, ttl: Optional[float] = None, maxsize: int = 128
+    ) -> None:
+        self.redis = redis
+        self.bus = bus
+        self.namespace = namespace
+        # Redis expiry in seconds, None keeps values until they are replaced
+        self.ttl = ttl
+        self.local: TTLCache[str, Any] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self._listeners: List[InvalidationListener] = []
+        self._listener_tasks: Set[asyncio.Task] = set()
+        bus.register(self)
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.namespace}:{key}"
+
+    def add_listener(self, listener: InvalidationListener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: InvalidationListener):
+        self._listeners.remove(listener)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        async def load():
+            raw = await self.redis.get(self._redis_key(key))
+            if raw is not None:
+                self.l2_hits += 1
+                return json.loads(raw)
+            self.l2_misses += 1
+            value = await loader()
+            # A value written meanwhile is newer than what was loaded
+            await self._store(key, value, nx=True)
+            return value
+
+        return await self.local.get_or_load(key, load)
+
+    async def _store(self, key: str, value: Any, *, nx: bool = False):
+        ttl = int(self.ttl) if self.ttl is not None else None
+        await self.redis.set(self._redis_key(key), json.dumps(value), ex=ttl, nx=nx)
+
+    async def set(self, key: str, value: Any):
+        """Replace ``key`` in both tiers and tell other processes"""
+        await self._store(key, value)
+        self.local.set(key, value)
+        await self.bus.publish(self.namespace, key)
+
+    async def invalidate(self, key: str):
+        """Drop ``key`` from both tiers, the next read loads it again"""
+        self.local.invalidate(key)
+        await self.redis.delete(self._redis_key(key))
+        await self.bus.publish(self.namespace, key)
+
+    def drop_local(self, key: Optional[str]):
+        if key is None:
+            self.local.clear()
+        else:
+            self.local.invalidate(key)
+        for listener in self._listeners:
+            task = asyncio.create_task(self._run_listener(listener, key))
+            self._listener_tasks.add(task)
+            task.add_done_callback(self._listener_tasks.discard)
+
+    async def _run_listener(self, listener: InvalidationListener, key: Optional[str]):
+        try:
+            await listener(key)
+        except Exception as e:
+            logger.error("Cache invalidation listener of %s failed", self.namespace, exc_info=e)
+
+    def stats(self) -> Dict[str, float]:
+        stats = self.local.stats()
+        stats["l2_hits"] = self.l2_hits
+        stats["l2_misses"] = self.l2_misses
+        return stats